@@ -0,0 +1,49 @@
+"""add room_stats
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'room_stats',
+        sa.Column('room_id', sa.String(length=100), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+        sa.Column('last_message_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_message_preview', sa.String(length=200), nullable=True),
+        sa.PrimaryKeyConstraint('room_id')
+    )
+    op.create_index(op.f('ix_room_stats_last_message_at'), 'room_stats', ['last_message_at'], unique=False)
+
+    # Backfill from the existing history once, later changes are applied incrementally
+    op.execute(
+        """
+        INSERT INTO room_stats (room_id, message_count, last_message_id)
+        SELECT room_id, COUNT(*), MAX(id) FROM messages GROUP BY room_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE room_stats SET
+            last_message_at = (SELECT created_at FROM messages WHERE messages.id = room_stats.last_message_id),
+            last_message_preview = (SELECT SUBSTR(content, 1, 100) FROM messages WHERE messages.id = room_stats.last_message_id)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_room_stats_last_message_at'), table_name='room_stats')
+    op.drop_table('room_stats')
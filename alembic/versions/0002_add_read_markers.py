@@ -0,0 +1,34 @@
+"""add read_markers
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'read_markers',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('room_id', sa.String(length=100), nullable=False),
+        sa.Column('last_read_message_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'room_id')
+    )
+    op.create_index('ix_messages_room_id_id', 'messages', ['room_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_room_id_id', table_name='messages')
+    op.drop_table('read_markers')
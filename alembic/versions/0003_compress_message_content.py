@@ -0,0 +1,134 @@
+"""compress message content
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+messages = sa.table(
+    'messages',
+    sa.column('id', sa.Integer()),
+    sa.column('content', sa.Text()),
+    sa.column('compressed_content', sa.LargeBinary()),
+    sa.column('dictionary_id', sa.Integer()),
+)
+compression_dictionaries = sa.table(
+    'compression_dictionaries',
+    sa.column('id', sa.Integer()),
+    sa.column('data', sa.LargeBinary()),
+)
+
+
+def backfill_compressed_content() -> None:
+    """Compress existing bodies over MESSAGE_COMPRESSION_THRESHOLD, walking the table in id batches."""
+    bind = op.get_bind()
+    threshold = settings.MESSAGE_COMPRESSION_THRESHOLD
+    last_id = 0
+    while threshold:
+        rows = bind.execute(
+            sa.select(messages.c.id, messages.c.content)
+            .where(messages.c.id > last_id, messages.c.content.isnot(None))
+            .order_by(messages.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for message_id, content in rows:
+            data = content.encode()
+            if len(data) < threshold:
+                continue
+            blob = zlib.compress(data, settings.MESSAGE_COMPRESSION_LEVEL)
+            # Same rule as app.compression.encode_content
+            if len(blob) <= len(data) * 0.9:
+                updates.append({'message_id': message_id, 'blob': blob})
+        if updates:
+            bind.execute(
+                messages.update()
+                .where(messages.c.id == sa.bindparam('message_id'))
+                .values(content=None, compressed_content=sa.bindparam('blob')),
+                updates
+            )
+
+
+def restore_content() -> None:
+    """Decompress every compressed body back into the content column."""
+    bind = op.get_bind()
+    dictionaries = dict(bind.execute(sa.select(compression_dictionaries.c.id, compression_dictionaries.c.data)).all())
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(messages.c.id, messages.c.compressed_content, messages.c.dictionary_id)
+            .where(messages.c.id > last_id, messages.c.compressed_content.isnot(None))
+            .order_by(messages.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for message_id, blob, dictionary_id in rows:
+            if dictionary_id is None:
+                data = zlib.decompress(blob)
+            else:
+                decompressor = zlib.decompressobj(zdict=dictionaries[dictionary_id])
+                data = decompressor.decompress(blob) + decompressor.flush()
+            updates.append({'message_id': message_id, 'text': data.decode()})
+        bind.execute(
+            messages.update()
+            .where(messages.c.id == sa.bindparam('message_id'))
+            .values(content=sa.bindparam('text'), compressed_content=None, dictionary_id=None),
+            updates
+        )
+
+
+def upgrade() -> None:
+    op.create_table(
+        'compression_dictionaries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('room_id', sa.String(length=100), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('sample_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_compression_dictionaries_room_id'), 'compression_dictionaries', ['room_id'], unique=False)
+    # Batch mode rebuilds the table on SQLite, which cannot alter constraints in place
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.add_column(sa.Column('compressed_content', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('dictionary_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_messages_dictionary_id_compression_dictionaries', 'compression_dictionaries', ['dictionary_id'], ['id']
+        )
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=True)
+    backfill_compressed_content()
+
+
+def downgrade() -> None:
+    restore_content()
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_constraint('fk_messages_dictionary_id_compression_dictionaries', type_='foreignkey')
+        batch_op.drop_column('dictionary_id')
+        batch_op.drop_column('compressed_content')
+    op.drop_index(op.f('ix_compression_dictionaries_room_id'), table_name='compression_dictionaries')
+    op.drop_table('compression_dictionaries')
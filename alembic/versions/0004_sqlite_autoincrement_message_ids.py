@@ -0,0 +1,33 @@
+"""sqlite autoincrement message ids
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def rebuild_messages(autoincrement: bool) -> None:
+    """Recreate the messages table on SQLite, where AUTOINCREMENT can only be set at creation."""
+    if op.get_bind().dialect.name != 'sqlite':
+        # Sequences on other databases never hand out an id twice
+        return
+    with op.batch_alter_table('messages', recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+
+
+def upgrade() -> None:
+    rebuild_messages(True)
+
+
+def downgrade() -> None:
+    rebuild_messages(False)
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from typing import Optional
+from fastapi import HTTPException, status
+from app.config import settings
+
+class LoadMonitor:
+    """Tracks event-loop lag and database pool wait for load shedding."""
+
+    def __init__(self):
+        self.loop_lag = 0.0
+        self.pool_wait = 0.0
+
+    async def run_lag_monitor(self, interval: float):
+        """Measure how late the event loop wakes up from a fixed sleep."""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(loop.time() - started - interval, 0.0)
+            # Rise immediately on a stall, decay gradually once it clears
+            self.loop_lag = lag if lag > self.loop_lag else self.loop_lag * 0.7 + lag * 0.3
+            # Shed requests never reach the pool, so let the pool wait decay on its own
+            self.pool_wait *= 0.9
+
+    def record_pool_wait(self, seconds: float):
+        """Record how long a session waited for a pooled connection."""
+        self.pool_wait = seconds if seconds > self.pool_wait else self.pool_wait * 0.9 + seconds * 0.1
+
+    def overload_reason(self) -> Optional[str]:
+        """Describe why the process is overloaded, or None if it is healthy."""
+        if settings.ADMISSION_MAX_LOOP_LAG_MS and self.loop_lag * 1000 > settings.ADMISSION_MAX_LOOP_LAG_MS:
+            return "event loop lag"
+        if settings.ADMISSION_MAX_POOL_WAIT_MS and self.pool_wait * 1000 > settings.ADMISSION_MAX_POOL_WAIT_MS:
+            return "database pool wait"
+        return None
+
+load_monitor = LoadMonitor()
+
+class PoolWaitTimer:
+    """Context manager timing a database connection checkout."""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        load_monitor.record_pool_wait(time.perf_counter() - self.started)
+        return False
+
+def websocket_rejection(connection_count: int, room_count: int, user_count: int) -> Optional[str]:
+    """Check whether a new WebSocket connection should be refused."""
+    if settings.ADMISSION_MAX_CONNECTIONS and connection_count >= settings.ADMISSION_MAX_CONNECTIONS:
+        return "Server connection limit reached"
+    if settings.ADMISSION_MAX_ROOM_CONNECTIONS and room_count >= settings.ADMISSION_MAX_ROOM_CONNECTIONS:
+        return "Room connection limit reached"
+    if settings.ADMISSION_MAX_USER_CONNECTIONS and user_count >= settings.ADMISSION_MAX_USER_CONNECTIONS:
+        return "User connection limit reached"
+    reason = load_monitor.overload_reason()
+    if reason:
+        return f"Server overloaded ({reason})"
+    return None
+
+def shed_load():
+    """Dependency rejecting expensive requests while the process is overloaded."""
+    reason = load_monitor.overload_reason()
+    if reason:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server overloaded ({reason}), try again later",
+            headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)},
+        )
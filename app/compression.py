@@ -0,0 +1,141 @@
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from app.config import settings
+from app.database import SessionLocal
+
+# zlib only looks back 32 KiB, a larger preset dictionary is never used
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+# How long the active dictionary of a room is cached before it is looked up again
+ACTIVE_DICTIONARY_TTL = 60.0
+
+# Stored form of a message body: (plain text, compressed bytes, dictionary id)
+StoredContent = Tuple[Optional[str], Optional[bytes], Optional[int]]
+
+def compress(data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+    """Compress with zlib, optionally primed with a preset dictionary."""
+    if dictionary is None:
+        return zlib.compress(data, settings.MESSAGE_COMPRESSION_LEVEL)
+    compressor = zlib.compressobj(settings.MESSAGE_COMPRESSION_LEVEL, zdict=dictionary)
+    return compressor.compress(data) + compressor.flush()
+
+def decompress(blob: bytes, dictionary: Optional[bytes] = None) -> bytes:
+    """Reverse compress(), the same dictionary must be given."""
+    if dictionary is None:
+        return zlib.decompress(blob)
+    decompressor = zlib.decompressobj(zdict=dictionary)
+    return decompressor.decompress(blob) + decompressor.flush()
+
+def train_dictionary(samples: List[str], size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """Build a zlib preset dictionary from sample messages.
+
+    zlib has no trainer, so the dictionary is made of the lines and words that
+    repeat across samples, weighted by the bytes they would save, with the
+    most valuable ones last where zlib finds matches at the shortest distance.
+    """
+    lines = Counter()
+    words = Counter()
+    for sample in samples:
+        for line in set(sample.splitlines()):
+            line = line.strip()
+            if len(line) >= 8:
+                lines[line] += 1
+        for word in set(sample.split()):
+            if len(word) >= 4:
+                words[word] += 1
+
+    candidates = [(count * len(line), line + "\n") for line, count in lines.items() if count > 1]
+    candidates += [(count * len(word), word + " ") for word, count in words.items() if count > 1]
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    chosen: List[bytes] = []
+    total = 0
+    for _, fragment in candidates:
+        encoded = fragment.encode()
+        if total + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        total += len(encoded)
+    return b"".join(reversed(chosen))
+
+class DictionaryStore:
+    """Per-room compression dictionaries, cached in memory.
+
+    Dictionaries are immutable once stored, so they are cached forever by id;
+    which dictionary is active for a room is re-read every
+    ACTIVE_DICTIONARY_TTL seconds so newly trained ones are picked up.
+    """
+
+    def __init__(self):
+        self.dictionaries: Dict[int, bytes] = {}
+        # (dictionary id or None, lookup time) by room_id
+        self.active: Dict[str, Tuple[Optional[int], float]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, dictionary_id: int) -> bytes:
+        """Get a dictionary by id, loading it on first use."""
+        with self.lock:
+            dictionary = self.dictionaries.get(dictionary_id)
+        if dictionary is None:
+            db = SessionLocal()
+            try:
+                dictionary = db.execute(
+                    text("SELECT data FROM compression_dictionaries WHERE id = :id"), {"id": dictionary_id}
+                ).scalar_one()
+            finally:
+                db.close()
+            with self.lock:
+                self.dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def active_for(self, room_id: str) -> Optional[Tuple[int, bytes]]:
+        """Get the newest dictionary of a room as (id, data), or None."""
+        now = time.monotonic()
+        with self.lock:
+            cached = self.active.get(room_id)
+        if cached is None or now - cached[1] > ACTIVE_DICTIONARY_TTL:
+            db = SessionLocal()
+            try:
+                dictionary_id = db.execute(
+                    text("SELECT max(id) FROM compression_dictionaries WHERE room_id = :room_id"), {"room_id": room_id}
+                ).scalar()
+            finally:
+                db.close()
+            with self.lock:
+                self.active[room_id] = (dictionary_id, now)
+        else:
+            dictionary_id = cached[0]
+        return (dictionary_id, self.get(dictionary_id)) if dictionary_id is not None else None
+
+    def activate(self, room_id: str, dictionary_id: int, dictionary: bytes):
+        """Use a newly stored dictionary for the room's next messages."""
+        with self.lock:
+            self.dictionaries[dictionary_id] = dictionary
+            self.active[room_id] = (dictionary_id, time.monotonic())
+
+dictionary_store = DictionaryStore()
+
+def encode_content(content: str, room_id: str) -> StoredContent:
+    """Choose how to store a message body, compressed only when it is long and actually shrinks."""
+    data = content.encode()
+    if not settings.MESSAGE_COMPRESSION_THRESHOLD or len(data) < settings.MESSAGE_COMPRESSION_THRESHOLD:
+        return content, None, None
+
+    active = dictionary_store.active_for(room_id)
+    dictionary_id, dictionary = active if active else (None, None)
+    blob = compress(data, dictionary)
+    # Keep the text searchable and cheap to read when it barely shrinks
+    if len(blob) > len(data) * 0.9:
+        return content, None, None
+    return None, blob, dictionary_id
+
+def decode_content(content: Optional[str], blob: Optional[bytes], dictionary_id: Optional[int]) -> str:
+    """Turn a stored message body back into text."""
+    if blob is None:
+        return content
+    dictionary = dictionary_store.get(dictionary_id) if dictionary_id is not None else None
+    return decompress(blob, dictionary).decode()
@@ -14,6 +14,20 @@ class Settings:
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "postgresql://postgres:umesh@@@1234567@localhost:5432/chat_app")
     
+    # Optional read replica for history and admin reads
+    READ_DATABASE_URL: str = os.getenv("READ_DATABASE_URL", "")
+    REPLICA_MAX_LAG: float = float(os.getenv("REPLICA_MAX_LAG", "5"))
+    REPLICA_CONNECT_TIMEOUT: float = float(os.getenv("REPLICA_CONNECT_TIMEOUT", "2"))
+    REPLICA_HEALTH_CHECK_INTERVAL: float = float(os.getenv("REPLICA_HEALTH_CHECK_INTERVAL", "2"))
+    READ_YOUR_WRITES_WINDOW: float = float(os.getenv("READ_YOUR_WRITES_WINDOW", "10"))
+    
+    # SQLite profile, used when DATABASE_URL starts with sqlite://
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_WRITE_BATCH_SIZE: int = int(os.getenv("SQLITE_WRITE_BATCH_SIZE", "256"))
+    
     # JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY", generate_secret_key(64))
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
@@ -23,5 +37,68 @@ class Settings:
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
+    
+    # Production server (python run.py --production), rooms are not shared between workers
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    WS_MAX_SIZE: int = int(os.getenv("WS_MAX_SIZE", str(64 * 1024)))
+    WS_PING_INTERVAL: float = float(os.getenv("WS_PING_INTERVAL", "20"))
+    WS_PING_TIMEOUT: float = float(os.getenv("WS_PING_TIMEOUT", "20"))
+    WS_PER_MESSAGE_DEFLATE: bool = os.getenv("WS_PER_MESSAGE_DEFLATE", "False").lower() == "true"
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+    
+    # Room statistics
+    ROOM_STATS_FLUSH_INTERVAL: float = float(os.getenv("ROOM_STATS_FLUSH_INTERVAL", "2.0"))
+    ROOM_STATS_PREVIEW_LENGTH: int = int(os.getenv("ROOM_STATS_PREVIEW_LENGTH", "100"))
+    
+    # Message compression (bodies of at least this many bytes are stored zlib compressed, 0 disables)
+    MESSAGE_COMPRESSION_THRESHOLD: int = int(os.getenv("MESSAGE_COMPRESSION_THRESHOLD", "512"))
+    MESSAGE_COMPRESSION_LEVEL: int = int(os.getenv("MESSAGE_COMPRESSION_LEVEL", "6"))
+    
+    # Read markers
+    READ_MARKERS_FLUSH_INTERVAL: float = float(os.getenv("READ_MARKERS_FLUSH_INTERVAL", "5.0"))
+    UNREAD_COUNT_LIMIT: int = int(os.getenv("UNREAD_COUNT_LIMIT", "100"))
+    
+    # History page caching
+    HISTORY_CACHE_SIZE: int = int(os.getenv("HISTORY_CACHE_SIZE", "1024"))
+    HISTORY_CACHE_TTL: float = float(os.getenv("HISTORY_CACHE_TTL", "300"))
+    HISTORY_CACHE_MAX_AGE: int = int(os.getenv("HISTORY_CACHE_MAX_AGE", "60"))
+    WS_HISTORY_MAX_LIMIT: int = int(os.getenv("WS_HISTORY_MAX_LIMIT", "100"))
+    
+    # Admission control (0 disables a limit)
+    ADMISSION_MAX_CONNECTIONS: int = int(os.getenv("ADMISSION_MAX_CONNECTIONS", "10000"))
+    ADMISSION_MAX_ROOM_CONNECTIONS: int = int(os.getenv("ADMISSION_MAX_ROOM_CONNECTIONS", "0"))
+    ADMISSION_MAX_USER_CONNECTIONS: int = int(os.getenv("ADMISSION_MAX_USER_CONNECTIONS", "20"))
+    ADMISSION_MAX_LOOP_LAG_MS: float = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "250"))
+    ADMISSION_MAX_POOL_WAIT_MS: float = float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", "1000"))
+    ADMISSION_LAG_CHECK_INTERVAL: float = float(os.getenv("ADMISSION_LAG_CHECK_INTERVAL", "0.25"))
+    ADMISSION_RETRY_AFTER: int = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+    
+    # Presence (joins and leaves are coalesced per window; 0 size disables suppression)
+    PRESENCE_COALESCE_WINDOW: float = float(os.getenv("PRESENCE_COALESCE_WINDOW", "1.0"))
+    PRESENCE_MAX_ROOM_SIZE: int = int(os.getenv("PRESENCE_MAX_ROOM_SIZE", "500"))
+    
+    # Ephemeral events (typing indicators): minimum seconds between relays per user and room
+    EPHEMERAL_DEBOUNCE: float = float(os.getenv("EPHEMERAL_DEBOUNCE", "2.0"))
+    
+    # Profiling (0 disables slow-handler capture)
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+    PROFILE_SLOW_HANDLER_MS: float = float(os.getenv("PROFILE_SLOW_HANDLER_MS", "0"))
+    
+    # SQL instrumentation (0 disables the slow-query log and N+1 warnings)
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "200"))
+    N_PLUS_ONE_THRESHOLD: int = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+    
+    # Traffic capture (empty path disables recording, {pid} is replaced by the process id)
+    TRAFFIC_CAPTURE_PATH: str = os.getenv("TRAFFIC_CAPTURE_PATH", "")
+    TRAFFIC_CAPTURE_SALT: str = os.getenv("TRAFFIC_CAPTURE_SALT", "")
+    TRAFFIC_CAPTURE_QUEUE_SIZE: int = int(os.getenv("TRAFFIC_CAPTURE_QUEUE_SIZE", "100000"))
+    
+    # Logging (repeated statements pass LOG_RATE_LIMIT_BURST times per window, then 1 in LOG_SAMPLE_RATE)
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_RATE_LIMIT_WINDOW: float = float(os.getenv("LOG_RATE_LIMIT_WINDOW", "10"))
+    LOG_RATE_LIMIT_BURST: int = int(os.getenv("LOG_RATE_LIMIT_BURST", "10"))
+    LOG_SAMPLE_RATE: int = int(os.getenv("LOG_SAMPLE_RATE", "100"))
 
 settings = Settings() 
\ No newline at end of file
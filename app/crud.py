@@ -1,9 +1,19 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List, Optional
-from app.models import User, Message, UserRole
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import desc, func
+from typing import Iterator, List, Optional, Tuple
+from app.models import User, Message, UserRole, CompressionDictionary
 from app.schemas import UserCreate, MessageCreate
 from app.auth import get_password_hash, verify_password
+from app.room_stats import room_stats
+from app.history_cache import history_cache
+from app.database import write_queue, record_write
+from app.compression import encode_content, decode_content
+
+def _insert(session: Session, instance):
+    """Insert a row on the single-writer session."""
+    session.add(instance)
+    session.flush()
+    return instance
 
 # User CRUD operations
 def get_user_by_username(db: Session, username: str) -> Optional[User]:
@@ -27,6 +37,8 @@ def create_user(db: Session, user: UserCreate) -> User:
         hashed_password=hashed_password,
         role=user.role
     )
+    if write_queue is not None:
+        return write_queue.run(lambda session: _insert(session, db_user))
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
@@ -45,19 +57,58 @@ def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
     """Get all users with pagination."""
     return db.query(User).offset(skip).limit(limit).all()
 
+def iter_users(db: Session, after_id: Optional[int] = None, batch_size: int = 1000) -> Iterator[Tuple]:
+    """Stream all users in id order using a server-side cursor."""
+    query = db.query(User.id, User.username, User.email, User.role, User.created_at)
+    
+    if after_id:
+        query = query.filter(User.id > after_id)
+    
+    return iter(query.order_by(User.id).yield_per(batch_size))
+
 # Message CRUD operations
-def create_message(db: Session, message: MessageCreate, user_id: int) -> Message:
-    """Create a new message."""
+def _build_message(message: MessageCreate, user_id: int) -> Message:
+    stored_content, compressed_content, dictionary_id = encode_content(message.content, message.room_id)
     db_message = Message(
-        content=message.content,
+        stored_content=stored_content,
+        compressed_content=compressed_content,
+        dictionary_id=dictionary_id,
         room_id=message.room_id,
         user_id=user_id
     )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    # Room stats and the broadcast read the text, it need not be decompressed again
+    db_message._content = message.content
     return db_message
 
+def _message_created(db_message: Message, user_id: int) -> Message:
+    room_stats.record_message(db_message)
+    record_write(user_id)
+    return db_message
+
+def create_message(db: Session, message: MessageCreate, user_id: int) -> Message:
+    """Create a new message."""
+    db_message = _build_message(message, user_id)
+    if write_queue is not None:
+        db_message = write_queue.run(lambda session: _insert(session, db_message))
+    else:
+        db.add(db_message)
+        db.commit()
+        db.refresh(db_message)
+    return _message_created(db_message, user_id)
+
+async def create_message_async(db: Session, message: MessageCreate, user_id: int) -> Message:
+    """Create a new message from an async handler.
+
+    On SQLite the insert is awaited on the writer queue, so concurrent
+    WebSocket handlers are grouped into one commit instead of each blocking
+    the event loop until its own write is done.
+    """
+    if write_queue is None:
+        return create_message(db, message, user_id)
+    db_message = _build_message(message, user_id)
+    db_message = await write_queue.run_async(lambda session: _insert(session, db_message))
+    return _message_created(db_message, user_id)
+
 def get_messages_by_room(
     db: Session, 
     room_id: str, 
@@ -66,13 +117,87 @@ def get_messages_by_room(
     cursor: Optional[int] = None
 ) -> List[Message]:
     """Get messages for a specific room with cursor-based pagination."""
-    query = db.query(Message).filter(Message.room_id == room_id)
+    # Load authors in the same query, the response and WebSocket frames need them
+    query = db.query(Message).options(joinedload(Message.user)).filter(Message.room_id == room_id)
     
-    if cursor:
+    if cursor is not None:
         query = query.filter(Message.id < cursor)
     
     return query.order_by(desc(Message.id)).offset(skip).limit(limit).all()
 
+def get_last_message_id(db: Session, room_id: str) -> Optional[int]:
+    """Get the highest message id of a room visible to this session."""
+    return db.query(func.max(Message.id)).filter(Message.room_id == room_id).scalar()
+
+def get_history_page(
+    db: Session,
+    room_id: str,
+    cursor: Optional[int] = None,
+    limit: int = 50
+) -> List[Tuple]:
+    """Get one page of a room's history with author names in a single query.
+    
+    Rows carry the stored form of the content, decode it with decode_content
+    when the page is serialized.
+    """
+    query = (
+        db.query(
+            Message.id, Message.stored_content, Message.compressed_content, Message.dictionary_id,
+            Message.user_id, User.username, Message.created_at
+        )
+        .join(User, Message.user_id == User.id)
+        .filter(Message.room_id == room_id)
+    )
+    
+    if cursor is not None:
+        query = query.filter(Message.id < cursor)
+    
+    return query.order_by(desc(Message.id)).limit(limit).all()
+
+def iter_messages_by_room(
+    db: Session,
+    room_id: str,
+    after_id: Optional[int] = None,
+    batch_size: int = 1000
+) -> Iterator[Tuple]:
+    """Stream all messages of a room in id order using a server-side cursor."""
+    query = (
+        db.query(
+            Message.id, Message.room_id, Message.user_id, User.username,
+            Message.stored_content, Message.compressed_content, Message.dictionary_id, Message.created_at
+        )
+        .join(User, Message.user_id == User.id)
+        .filter(Message.room_id == room_id)
+    )
+    
+    if after_id:
+        query = query.filter(Message.id > after_id)
+    
+    # Each body is decompressed only when the export reaches its row
+    for row in query.order_by(Message.id).yield_per(batch_size):
+        yield (*row[:4], decode_content(*row[4:7]), row.created_at)
+
+def get_compression_samples(db: Session, room_id: str, limit: int = 1000) -> List[str]:
+    """Get the text of a room's most recent compressed messages, newest first."""
+    rows = (
+        db.query(Message.compressed_content, Message.dictionary_id)
+        .filter(Message.room_id == room_id, Message.compressed_content.isnot(None))
+        .order_by(desc(Message.id))
+        .limit(limit)
+        .all()
+    )
+    return [decode_content(None, compressed_content, dictionary_id) for compressed_content, dictionary_id in rows]
+
+def create_compression_dictionary(db: Session, room_id: str, data: bytes, sample_count: int) -> CompressionDictionary:
+    """Store a trained compression dictionary for a room."""
+    dictionary = CompressionDictionary(room_id=room_id, data=data, sample_count=sample_count)
+    if write_queue is not None:
+        return write_queue.run(lambda session: _insert(session, dictionary))
+    db.add(dictionary)
+    db.commit()
+    db.refresh(dictionary)
+    return dictionary
+
 def get_message_by_id(db: Session, message_id: int) -> Optional[Message]:
     """Get message by ID."""
     return db.query(Message).filter(Message.id == message_id).first()
@@ -88,6 +213,12 @@ def delete_message(db: Session, message_id: int, user_id: int) -> bool:
     if message.user_id != user_id and user.role != UserRole.ADMIN:
         return False
     
-    db.delete(message)
-    db.commit()
+    if write_queue is not None:
+        write_queue.run(lambda session: session.query(Message).filter(Message.id == message_id).delete())
+    else:
+        db.delete(message)
+        db.commit()
+    room_stats.record_delete(message.room_id, message.id)
+    record_write(user_id)
+    history_cache.invalidate(message.room_id, message.id)
     return True 
\ No newline at end of file
@@ -1,10 +1,59 @@
-from sqlalchemy import create_engine
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from fastapi import Depends
 from app.config import settings
+from app.admission import PoolWaitTimer
+
+logger = logging.getLogger(__name__)
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def create_sqlite_engine(url: str):
+    """Create an engine tuned for concurrent readers and a single writer."""
+    sqlite_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    )
+
+    @event.listens_for(sqlite_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself, pysqlite's implicit transactions break savepoints
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run concurrently with the writer
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    @event.listens_for(sqlite_engine, "begin")
+    def begin_sqlite_transaction(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    return sqlite_engine
 
 # Create database engine
-engine = create_engine(settings.DATABASE_URL)
+if is_sqlite(settings.DATABASE_URL):
+    engine = create_sqlite_engine(settings.DATABASE_URL)
+else:
+    engine = create_engine(settings.DATABASE_URL)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -12,10 +61,346 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Create Base class
 Base = declarative_base()
 
+class SingleWriterQueue:
+    """Serializes writes through one thread and commits them in groups.
+
+    SQLite allows a single writer at a time; funnelling inserts through one
+    connection avoids "database is locked" errors, and committing queued
+    jobs together amortizes the fsync over the whole group.
+    """
+
+    def __init__(self, session_factory, batch_size: int):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.jobs: "queue.Queue[tuple]" = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                    self.thread.start()
+
+    def submit(self, job: Callable[[Session], object]) -> Future:
+        """Queue a job that receives the writer session; its result resolves the future."""
+        self._ensure_started()
+        future: Future = Future()
+        # Run the job in the caller's context so its queries count towards the caller
+        self.jobs.put((job, future, contextvars.copy_context()))
+        return future
+
+    def run(self, job: Callable[[Session], object]):
+        """Run a job on the writer thread and wait for its committed result."""
+        return self.submit(job).result()
+
+    async def run_async(self, job: Callable[[Session], object]):
+        """Await a job's committed result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(job))
+
+    def close(self):
+        """Commit the jobs still queued and stop the writer thread."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.jobs.put(None)
+            thread.join()
+
+    def _run(self):
+        session = self.session_factory(expire_on_commit=False)
+        stopping = False
+        while not stopping:
+            job = self.jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.batch_size:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            try:
+                results = [(future, context.run(job, session)) for job, future, context in batch]
+                session.commit()
+            except Exception:
+                session.rollback()
+                session.expunge_all()
+                # Retry the group one job per transaction so only the failing job errors
+                for job, future, context in batch:
+                    try:
+                        result = context.run(job, session)
+                        session.commit()
+                        future.set_result(result)
+                    except Exception as e:
+                        session.rollback()
+                        future.set_exception(e)
+                    finally:
+                        session.expunge_all()
+                continue
+
+            session.expunge_all()
+            for future, result in results:
+                future.set_result(result)
+        session.close()
+
+# Inserts go through the writer queue when running on SQLite
+write_queue: Optional[SingleWriterQueue] = (
+    SingleWriterQueue(SessionLocal, settings.SQLITE_WRITE_BATCH_SIZE) if is_sqlite(settings.DATABASE_URL) else None
+)
+
 # Dependency to get database session
 def get_db():
     db = SessionLocal()
     try:
+        # Check out the connection up front so pool wait feeds admission control
+        with PoolWaitTimer():
+            db.connection()
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def create_replica_engine(url: str):
+    """Create the engine for the read replica."""
+    if is_sqlite(url):
+        return create_sqlite_engine(url)
+    connect_args = {}
+    if url.startswith("postgresql"):
+        # Fail fast so an unreachable replica falls back instead of stalling reads,
+        # and refuse writes that were routed to the replica by mistake
+        connect_args = {
+            "connect_timeout": max(int(settings.REPLICA_CONNECT_TIMEOUT), 1),
+            "options": "-c default_transaction_read_only=on",
+        }
+    return create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+
+class ReplicaRouter:
+    """Decides whether a read may be served by the replica.
+
+    Reads fall back to the primary while the replica is unreachable or lags
+    more than REPLICA_MAX_LAG, and for users who wrote within
+    READ_YOUR_WRITES_WINDOW so they always see their own messages.
+    """
+
+    def __init__(self, replica_engine):
+        self.engine = replica_engine
+        self.healthy = True
+        self.lag = 0.0
+        # Last write time by user_id, only writes made by this process are known
+        self.recent_writes: Dict[int, float] = {}
+        self.lock = threading.Lock()
+
+    def record_write(self, user_id: int):
+        now = time.monotonic()
+        with self.lock:
+            self.recent_writes[user_id] = now
+            if len(self.recent_writes) > 10000:
+                cutoff = now - settings.READ_YOUR_WRITES_WINDOW
+                self.recent_writes = {key: at for key, at in self.recent_writes.items() if at > cutoff}
+
+    def wrote_recently(self, user_id: int) -> bool:
+        with self.lock:
+            written_at = self.recent_writes.get(user_id)
+        return written_at is not None and time.monotonic() - written_at < settings.READ_YOUR_WRITES_WINDOW
+
+    def mark_unhealthy(self, reason: str):
+        if self.healthy:
+            logger.warning("Read replica unhealthy (%s), reading from the primary", reason)
+        self.healthy = False
+
+    def check(self):
+        """Probe the replica's connectivity and replication lag."""
+        try:
+            with self.engine.connect() as connection:
+                if self.engine.dialect.name == "postgresql":
+                    # Caught up when everything received is replayed, even if the primary is idle
+                    lag = connection.execute(text(
+                        "SELECT CASE WHEN NOT pg_is_in_recovery() "
+                        "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                    )).scalar()
+                else:
+                    connection.execute(text("SELECT 1"))
+                    lag = 0
+        except Exception as e:
+            self.mark_unhealthy(repr(e))
+            return
+
+        self.lag = float(lag or 0)
+        if settings.REPLICA_MAX_LAG and self.lag > settings.REPLICA_MAX_LAG:
+            self.mark_unhealthy(f"lag {self.lag:.1f}s")
+        elif not self.healthy:
+            logger.info("Read replica healthy again, lag %.1fs", self.lag)
+            self.healthy = True
+
+    async def run_health_checks(self, interval: float):
+        """Periodically probe the replica until cancelled."""
+        while True:
+            await asyncio.to_thread(self.check)
+            await asyncio.sleep(interval)
+
+    def session(self, user_id: Optional[int] = None) -> Optional[Session]:
+        """Open a replica session, or return None when the read should use the primary."""
+        if not self.healthy or (user_id is not None and self.wrote_recently(user_id)):
+            return None
+        db = ReadSessionLocal()
+        try:
+            db.connection()
+        except Exception as e:
+            db.close()
+            self.mark_unhealthy(repr(e))
+            return None
+        return db
+
+# Optional read replica for history and admin reads
+if settings.READ_DATABASE_URL:
+    read_engine = create_replica_engine(settings.READ_DATABASE_URL)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    replica: Optional[ReplicaRouter] = ReplicaRouter(read_engine)
+
+    @event.listens_for(read_engine, "handle_error")
+    def mark_replica_unhealthy(context):
+        if context.is_disconnect:
+            replica.mark_unhealthy(repr(context.original_exception))
+else:
+    read_engine = None
+    ReadSessionLocal = None
+    replica = None
+
+def replica_session(user_id: Optional[int] = None) -> Optional[Session]:
+    """Open a session on the read replica, or None when the primary must serve the read."""
+    return replica.session(user_id) if replica is not None else None
+
+def record_write(user_id: int):
+    """Route the user's reads to the primary until the replica has caught up."""
+    if replica is not None:
+        replica.record_write(user_id)
+
+def get_read_db(db: Session = Depends(get_db)):
+    """Dependency for reads that tolerate replication lag."""
+    read_db = replica_session()
+    if read_db is None:
+        yield db
+        return
+    try:
+        yield read_db
+    finally:
+        read_db.close()
+
+class QueryStats:
+    """Queries executed while handling one HTTP request or WebSocket message."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        # Executions by SQL text; lazy loads in a loop repeat the same statement
+        self.statements: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, statement: str, seconds: float):
+        with self.lock:
+            self.count += 1
+            self.seconds += seconds
+            self.statements[statement] += 1
+
+    def report(self):
+        """Log the totals and any statement repeated often enough to be an N+1."""
+        if not self.count:
+            return
+        logger.debug("%s: %d queries in %.1f ms", self.name, self.count, self.seconds * 1000)
+        if settings.N_PLUS_ONE_THRESHOLD:
+            for statement, executions in self.statements.items():
+                if executions >= settings.N_PLUS_ONE_THRESHOLD:
+                    logger.warning("Possible N+1 in %s: %d executions of %s", self.name, executions, statement[:500])
+
+_current_stats: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("query_stats", default=None)
+# Collectors opened by query_budget, counting queries from every thread
+_budget_stats: List[QueryStats] = []
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+    # The BEGIN emitted for SQLite is transaction control, not a query
+    if statement == "BEGIN":
+        return
+    stats = _current_stats.get()
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query in %s (%.1f ms): %s",
+            stats.name if stats else "background task", elapsed * 1000, statement[:1000]
+        )
+    if stats is not None:
+        stats.add(statement, elapsed)
+    for budget in list(_budget_stats):
+        budget.add(statement, elapsed)
+
+@contextmanager
+def track_queries(name: str) -> Iterator[QueryStats]:
+    """Count the queries made in this context and report them when it exits."""
+    stats = QueryStats(name)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+        stats.report()
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+@contextmanager
+def query_budget(max_queries: int) -> Iterator[QueryStats]:
+    """Fail when more than max_queries run inside the block, for use in tests.
+
+    Queries are counted from every thread, so requests made through a test
+    client are included:
+
+        with query_budget(3):
+            client.get("/chat/messages/general", headers=headers)
+    """
+    stats = QueryStats(f"query budget of {max_queries}")
+    _budget_stats.append(stats)
+    try:
+        yield stats
+    finally:
+        _budget_stats.remove(stats)
+    if stats.count > max_queries:
+        statements = "\n".join(f"  {count} x {statement}" for statement, count in stats.statements.most_common())
+        raise QueryBudgetExceeded(f"{stats.count} queries exceeds the budget of {max_queries}:\n{statements}")
+
+class QueryStatsMiddleware:
+    """ASGI middleware counting the queries of each HTTP request.
+
+    In debug mode responses carry `X-DB-Queries` and a `Server-Timing`
+    entry with the total database time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries(f"{scope['method']} {scope['path']}") as stats:
+            async def send_with_query_stats(message):
+                if message["type"] == "http.response.start" and settings.DEBUG:
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-queries", str(stats.count).encode()),
+                        (b"server-timing", f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'.encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_query_stats)
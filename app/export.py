@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List, Sequence
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Flush the encoded output to the client once this many bytes are buffered
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def _json_default(value):
+    """Serialize values the json module does not handle natively."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    return str(value)
+
+def _csv_value(value):
+    """Convert a row value to its CSV representation."""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    return value
+
+def encode_rows(rows: Iterable[Sequence], fields: List[str], fmt: str) -> Iterator[str]:
+    """Encode rows as NDJSON lines or CSV records, one string per row."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_csv_value(value) for value in row])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # The header is only emitted together with the first row, so make sure
+        # an empty export still produces a valid CSV document
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row)), default=_json_default) + "\n"
+
+def stream_export(rows: Iterable[Sequence], fields: List[str], fmt: str, compress: bool = False) -> Iterator[bytes]:
+    """Stream encoded rows in bounded chunks, optionally gzip-compressed."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    pending = []
+    pending_size = 0
+
+    for record in encode_rows(rows, fields, fmt):
+        data = record.encode("utf-8")
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= EXPORT_CHUNK_SIZE:
+            chunk = b"".join(pending)
+            pending = []
+            pending_size = 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b"".join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
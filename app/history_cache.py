@@ -0,0 +1,86 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+from app.config import settings
+
+CacheKey = Tuple[str, int, int, int]
+
+class CachedPage:
+    """An encoded history page and the id range it covers."""
+
+    def __init__(self, body: bytes, etag: str, lowest_id: int, cursor: int):
+        self.body = body
+        self.etag = etag
+        self.lowest_id = lowest_id
+        self.cursor = cursor
+        self.created_at = time.monotonic()
+
+def make_etag(body: bytes) -> str:
+    """Build a strong ETag from the encoded response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+class HistoryPageCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Encoded pages by (room_id, cursor, skip, limit), in LRU order
+        self.pages: "OrderedDict[CacheKey, CachedPage]" = OrderedDict()
+        # Cache keys by room, so deletes only inspect the affected room
+        self.room_keys: Dict[str, Set[CacheKey]] = {}
+        self.lock = threading.Lock()
+
+    def _remove(self, key: CacheKey):
+        self.pages.pop(key, None)
+        keys = self.room_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.room_keys[key[0]]
+
+    def get(self, room_id: str, cursor: int, skip: int, limit: int) -> Optional[CachedPage]:
+        """Get a cached page, or None when it is missing or expired."""
+        key = (room_id, cursor, skip, limit)
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None:
+                return None
+            # Deletes made by other processes are only seen through expiry
+            if time.monotonic() - page.created_at > self.ttl:
+                self._remove(key)
+                return None
+            self.pages.move_to_end(key)
+            return page
+
+    def put(self, room_id: str, cursor: int, skip: int, limit: int, body: bytes, lowest_id: int) -> CachedPage:
+        """Store an encoded page covering message ids in [lowest_id, cursor)."""
+        key = (room_id, cursor, skip, limit)
+        page = CachedPage(body, make_etag(body), lowest_id, cursor)
+        if self.max_entries <= 0:
+            return page
+        with self.lock:
+            self._remove(key)
+            self.pages[key] = page
+            self.room_keys.setdefault(room_id, set()).add(key)
+            while len(self.pages) > self.max_entries:
+                oldest_key = next(iter(self.pages))
+                self._remove(oldest_key)
+        return page
+
+    def invalidate(self, room_id: str, message_id: int):
+        """Drop every cached page of a room whose id range contains message_id."""
+        with self.lock:
+            for key in list(self.room_keys.get(room_id, ())):
+                page = self.pages[key]
+                if page.lowest_id <= message_id < page.cursor:
+                    self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.room_keys.clear()
+
+# Deletes on other worker processes only reach this cache through expiry, so a
+# page never outlives what clients may already cache under Cache-Control
+history_cache = HistoryPageCache(settings.HISTORY_CACHE_SIZE, min(settings.HISTORY_CACHE_TTL, settings.HISTORY_CACHE_MAX_AGE))
@@ -0,0 +1,125 @@
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+from app.config import settings
+
+# Record attributes copied into every JSON log line when present
+CONTEXT_FIELDS = ("room_id", "user_id", "connection_id", "suppressed")
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """Pass a burst of each repeated log statement per window, then sample.
+
+    Records are keyed by logger, level and unformatted message, so a flood
+    of the same error with different arguments collapses into one key.
+    """
+
+    def __init__(self, window: float, burst: int, sample_rate: int):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.sample_rate = max(sample_rate, 1)
+        # (window start, records seen, records suppressed) by statement
+        self.counters: Dict[Tuple[str, int, str], list] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            counter = self.counters.get(key)
+            if counter is None or now - counter[0] >= self.window:
+                if len(self.counters) > 10000:
+                    self.counters.clear()
+                suppressed = counter[2] if counter else 0
+                counter = self.counters[key] = [now, 0, suppressed]
+            counter[1] += 1
+            seen = counter[1]
+            if seen > self.burst and (seen - self.burst) % self.sample_rate:
+                counter[2] += 1
+                return False
+            suppressed, counter[2] = counter[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the arguments here; JSON encoding and traceback formatting
+        # happen on the listener thread, off the event loop
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+def setup_logging():
+    """Route application logs through a bounded queue to a background writer."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(RateLimitFilter(
+        settings.LOG_RATE_LIMIT_WINDOW,
+        settings.LOG_RATE_LIMIT_BURST,
+        settings.LOG_SAMPLE_RATE
+    ))
+
+    logger = logging.getLogger("app")
+    logger.setLevel(settings.LOG_LEVEL)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        logging.getLogger("app").removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
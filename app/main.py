@@ -1,18 +1,54 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.database import engine
+from app.database import engine, write_queue, replica, QueryStatsMiddleware
 from app.models import Base
+from app.config import settings
 from app.routers import auth, chat, admin
+from app.room_stats import room_stats
+from app.read_markers import read_markers
+from app.admission import load_monitor
+from app.profiling import ProfilingMiddleware, profiler
+from app.logging_config import setup_logging, shutdown_logging
+from app.traffic_capture import traffic_recorder
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background tasks."""
+    setup_logging()
+    profiler.start_watchdog(settings.PROFILE_SLOW_HANDLER_MS)
+    traffic_recorder.start(settings.TRAFFIC_CAPTURE_PATH, settings.TRAFFIC_CAPTURE_SALT, settings.TRAFFIC_CAPTURE_QUEUE_SIZE)
+    background_tasks = [
+        asyncio.create_task(room_stats.run_flusher(settings.ROOM_STATS_FLUSH_INTERVAL)),
+        asyncio.create_task(read_markers.run_flusher(settings.READ_MARKERS_FLUSH_INTERVAL)),
+        asyncio.create_task(load_monitor.run_lag_monitor(settings.ADMISSION_LAG_CHECK_INTERVAL)),
+    ]
+    if replica is not None:
+        background_tasks.append(asyncio.create_task(replica.run_health_checks(settings.REPLICA_HEALTH_CHECK_INTERVAL)))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    # The flushers' final writes are queued by now, commit them before exiting
+    if write_queue is not None:
+        write_queue.close()
+    engine.dispose()
+    if replica is not None:
+        replica.engine.dispose()
+    traffic_recorder.stop()
+    shutdown_logging()
+
 # Create FastAPI app
 app = FastAPI(
     title="Chat Application",
     description="A real-time chat application with JWT authentication and role-based access control",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -24,6 +60,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Add profiling middleware
+app.add_middleware(ProfilingMiddleware)
+
+# Add SQL instrumentation middleware
+app.add_middleware(QueryStatsMiddleware)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -45,4 +87,13 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy"} 
\ No newline at end of file
+    overload_reason = load_monitor.overload_reason()
+    health = {
+        "status": "overloaded" if overload_reason else "healthy",
+        "loop_lag_ms": round(load_monitor.loop_lag * 1000, 1),
+        "pool_wait_ms": round(load_monitor.pool_wait * 1000, 1)
+    }
+    if replica is not None:
+        health["replica"] = "healthy" if replica.healthy else "unhealthy"
+        health["replica_lag_s"] = round(replica.lag, 1)
+    return health 
\ No newline at end of file
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
 from app.database import Base
+from app.compression import decode_content
 
 class UserRole(str, enum.Enum):
     ADMIN = "admin"
@@ -26,10 +27,60 @@ class Message(Base):
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    content = Column(Text, nullable=False)
+    # Short bodies are stored as text, long ones zlib compressed (see app.compression)
+    stored_content = Column("content", Text, nullable=True)
+    compressed_content = Column(LargeBinary, nullable=True)
+    dictionary_id = Column(
+        Integer,
+        ForeignKey("compression_dictionaries.id", name="fk_messages_dictionary_id_compression_dictionaries"),
+        nullable=True
+    )
     room_id = Column(String(100), nullable=False, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationship
-    user = relationship("User", back_populates="messages") 
\ No newline at end of file
+    user = relationship("User", back_populates="messages")
+    
+    __table_args__ = (
+        # Serves history paging and unread counts as index range scans
+        Index("ix_messages_room_id_id", "room_id", "id"),
+        # Ids must never be reused: cached pages, read markers and clients assume
+        # they only grow, and SQLite hands out a deleted max rowid again without this
+        {"sqlite_autoincrement": True},
+    )
+    # Fetch created_at with the INSERT (RETURNING) instead of a follow-up SELECT
+    __mapper_args__ = {"eager_defaults": True}
+    
+    @property
+    def content(self) -> str:
+        """Message text, decompressed on first access."""
+        if getattr(self, "_content", None) is None:
+            self._content = decode_content(self.stored_content, self.compressed_content, self.dictionary_id)
+        return self._content
+
+class CompressionDictionary(Base):
+    __tablename__ = "compression_dictionaries"
+    
+    id = Column(Integer, primary_key=True)
+    room_id = Column(String(100), nullable=False, index=True)
+    data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class RoomStats(Base):
+    __tablename__ = "room_stats"
+    
+    room_id = Column(String(100), primary_key=True)
+    message_count = Column(Integer, default=0, nullable=False)
+    last_message_id = Column(Integer, nullable=True)
+    last_message_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    last_message_preview = Column(String(200), nullable=True)
+
+class ReadMarker(Base):
+    __tablename__ = "read_markers"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    room_id = Column(String(100), primary_key=True)
+    last_read_message_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
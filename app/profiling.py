@@ -0,0 +1,251 @@
+import itertools
+import json
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.auth import verify_token
+from app.models import UserRole
+
+Stack = Tuple[str, ...]
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+def _thread_stack(frame) -> Stack:
+    """Build a root-first stack of frame names."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+def _thread_names() -> Dict[int, str]:
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+class Profile:
+    """Aggregated stack samples from one profiling session."""
+
+    def __init__(self, profile_id: int, name: str, interval: float):
+        self.id = profile_id
+        self.name = name
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.sample_count = 0
+        self.samples: Counter = Counter()
+        self.done = False
+        # The sampler thread adds stacks while a download may be rendering them
+        self.lock = threading.Lock()
+
+    def add_stacks(self, frames: Dict[int, object], skip_thread: Optional[int] = None):
+        names = _thread_names()
+        stacks = [
+            (names.get(thread_id, str(thread_id)),) + _thread_stack(frame)
+            for thread_id, frame in frames.items()
+            if thread_id != skip_thread
+        ]
+        with self.lock:
+            self.samples.update(stacks)
+            self.sample_count += 1
+
+    def snapshot(self) -> Counter:
+        """Copy the samples collected so far, safe while sampling continues."""
+        with self.lock:
+            return Counter(self.samples)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 3),
+            "samples": self.sample_count,
+            "done": self.done,
+        }
+
+    def to_collapsed(self) -> str:
+        """Render in the collapsed-stack format used by flamegraph tools."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.snapshot().most_common())
+
+    def to_speedscope(self) -> str:
+        """Render as a speedscope sampled profile."""
+        frame_ids: Dict[str, int] = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, count in self.snapshot().items():
+            sample = []
+            for name in stack:
+                if name not in frame_ids:
+                    frame_ids[name] = len(frames)
+                    frames.append({"name": name})
+                sample.append(frame_ids[name])
+            samples.append(sample)
+            weights.append(count * self.interval)
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": self.name,
+            "exporter": "chat-application",
+        })
+
+class Profiler:
+    def __init__(self, max_profiles: int = 20):
+        self.max_profiles = max_profiles
+        self.profiles: "OrderedDict[int, Profile]" = OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.session: Optional[Profile] = None
+        # Handlers currently running, tracked only while slow-handler capture is enabled
+        self.in_flight: Dict[int, Tuple[str, float]] = {}
+        self.in_flight_ids = itertools.count(1)
+        self.watchdog: Optional[threading.Thread] = None
+
+    def _store(self, profile: Profile):
+        self.profiles[profile.id] = profile
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+
+    def _new_profile(self, name: str, interval: float) -> Profile:
+        with self.lock:
+            profile = Profile(next(self.ids), name, interval)
+            self._store(profile)
+        return profile
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        with self.lock:
+            return self.profiles.get(profile_id)
+
+    def list(self) -> List[dict]:
+        with self.lock:
+            profiles = list(reversed(self.profiles.values()))
+        return [profile.summary() for profile in profiles]
+
+    def _sample(self, profile: Profile, stop: threading.Event):
+        own_thread = threading.get_ident()
+        started = time.perf_counter()
+        while not stop.wait(profile.interval):
+            profile.add_stacks(sys._current_frames(), skip_thread=own_thread)
+        profile.duration = time.perf_counter() - started
+        profile.done = True
+
+    def start_session(self, seconds: float, interval: float) -> Optional[Profile]:
+        """Start a time-boxed sampling session, or None if one is running."""
+        with self.lock:
+            if self.session is not None and not self.session.done:
+                return None
+            profile = self.session = Profile(next(self.ids), f"session-{seconds:g}s", interval)
+            self._store(profile)
+        stop = threading.Event()
+        threading.Timer(seconds, stop.set).start()
+        threading.Thread(target=self._sample, args=(profile, stop), name="profiler", daemon=True).start()
+        return profile
+
+    @contextmanager
+    def profile_request(self, name: str, interval: float):
+        """Sample every thread for the duration of a single request."""
+        profile = self._new_profile(name, interval)
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(profile, stop), name="profiler", daemon=True)
+        sampler.start()
+        try:
+            yield profile
+        finally:
+            stop.set()
+
+    @contextmanager
+    def track(self, name: str):
+        """Track a running handler so the watchdog can capture it when slow."""
+        if self.watchdog is None:
+            yield
+            return
+        handler_id = next(self.in_flight_ids)
+        self.in_flight[handler_id] = (name, time.monotonic())
+        try:
+            yield
+        finally:
+            self.in_flight.pop(handler_id, None)
+
+    def _watch(self, threshold: float):
+        captured = set()
+        while True:
+            time.sleep(threshold / 2)
+            now = time.monotonic()
+            for handler_id, (name, started) in list(self.in_flight.items()):
+                if handler_id in captured or now - started < threshold:
+                    continue
+                captured.add(handler_id)
+                profile = self._new_profile(f"slow {name} ({(now - started) * 1000:.0f}ms)", now - started)
+                # Sync endpoints run in the threadpool, so capture every thread
+                profile.add_stacks(sys._current_frames(), skip_thread=threading.get_ident())
+                profile.duration = now - started
+                profile.done = True
+            captured.intersection_update(self.in_flight)
+
+    def start_watchdog(self, threshold_ms: float):
+        """Capture stacks of handlers running longer than threshold_ms."""
+        if self.watchdog is not None or threshold_ms <= 0:
+            return
+        self.watchdog = threading.Thread(target=self._watch, args=(threshold_ms / 1000,), name="slow-handler-watchdog", daemon=True)
+        self.watchdog.start()
+
+profiler = Profiler()
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def _is_admin_request(scope) -> bool:
+    authorization = _header(scope, b"authorization") or ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    token_data = verify_token(token)
+    return token_data is not None and token_data.role == UserRole.ADMIN
+
+class ProfilingMiddleware:
+    """ASGI middleware for per-request profiling and slow-handler tracking.
+
+    Admins can profile a single request by sending `X-Profile: 1`; the
+    response carries an `X-Profile-Id` to download from /admin/profile.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{scope['method']} {scope['path']}"
+        if _header(scope, b"x-profile") and _is_admin_request(scope):
+            with profiler.profile_request(name, settings.PROFILE_INTERVAL_MS / 1000) as profile:
+                async def send_with_profile_id(message):
+                    if message["type"] == "http.response.start":
+                        message = dict(message)
+                        message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", str(profile.id).encode())]
+                    await send(message)
+
+                await self.app(scope, receive, send_with_profile_id)
+            return
+
+        with profiler.track(name):
+            await self.app(scope, receive, send)
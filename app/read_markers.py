@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal, engine, write_queue
+from app.models import Message, ReadMarker
+
+# Rooms counted per UNION ALL statement in count_unread
+UNREAD_ROOMS_PER_QUERY = 200
+
+logger = logging.getLogger(__name__)
+
+class ReadMarkerBuffer:
+    def __init__(self):
+        # Highest read message id by (user_id, room_id), waiting to be flushed
+        self.pending: Dict[Tuple[int, str], int] = {}
+        self.lock = threading.Lock()
+
+    def mark_read(self, user_id: int, room_id: str, message_id: int):
+        """Move a user's read pointer forward, coalescing repeated updates."""
+        key = (user_id, room_id)
+        with self.lock:
+            if message_id > self.pending.get(key, 0):
+                self.pending[key] = message_id
+
+    def _take_pending(self) -> Dict[Tuple[int, str], int]:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def _restore_pending(self, pending: Dict[Tuple[int, str], int]):
+        """Put back markers from a failed flush so they are retried."""
+        with self.lock:
+            for key, message_id in pending.items():
+                if message_id > self.pending.get(key, 0):
+                    self.pending[key] = message_id
+
+    def _upsert(self, db: Session, rows: List[dict]):
+        dialect = engine.dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            statement = insert(ReadMarker).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=[ReadMarker.user_id, ReadMarker.room_id],
+                set_={
+                    "last_read_message_id": statement.excluded.last_read_message_id,
+                    "updated_at": func.now(),
+                },
+                # Never move a pointer backwards
+                where=ReadMarker.last_read_message_id < statement.excluded.last_read_message_id,
+            )
+            db.execute(statement)
+            return
+
+        for row in rows:
+            marker = db.get(ReadMarker, (row["user_id"], row["room_id"]))
+            if marker is None:
+                db.add(ReadMarker(**row))
+            elif marker.last_read_message_id < row["last_read_message_id"]:
+                marker.last_read_message_id = row["last_read_message_id"]
+
+    def flush(self, batch_size: int = 500):
+        """Write all pending read markers in batched upserts."""
+        pending = self._take_pending()
+        if not pending:
+            return
+
+        rows = [
+            {"user_id": user_id, "room_id": room_id, "last_read_message_id": message_id}
+            for (user_id, room_id), message_id in pending.items()
+        ]
+
+        if write_queue is not None:
+            # On SQLite all writes go through the single writer
+            def upsert_all(session: Session):
+                for start in range(0, len(rows), batch_size):
+                    self._upsert(session, rows[start:start + batch_size])
+            try:
+                write_queue.run(upsert_all)
+            except Exception:
+                self._restore_pending(pending)
+                raise
+            return
+
+        db = SessionLocal()
+        try:
+            for start in range(0, len(rows), batch_size):
+                self._upsert(db, rows[start:start + batch_size])
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._restore_pending(pending)
+            raise
+        finally:
+            db.close()
+
+    async def run_flusher(self, interval: float):
+        """Periodically flush pending read markers until cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as e:
+                    logger.error("Read marker flush failed: %s", e)
+        finally:
+            await asyncio.to_thread(self.flush)
+
+    def get_markers(self, db: Session, user_id: int, room_ids: Optional[List[str]] = None) -> Dict[str, int]:
+        """Get a user's read pointers by room, including unflushed updates."""
+        query = db.query(ReadMarker.room_id, ReadMarker.last_read_message_id).filter(ReadMarker.user_id == user_id)
+        if room_ids:
+            query = query.filter(ReadMarker.room_id.in_(room_ids))
+        markers = {room_id: message_id for room_id, message_id in query.all()}
+
+        with self.lock:
+            pending = [
+                (room_id, message_id)
+                for (pending_user_id, room_id), message_id in self.pending.items()
+                if pending_user_id == user_id
+            ]
+        for room_id, message_id in pending:
+            if room_ids and room_id not in room_ids:
+                continue
+            if message_id > markers.get(room_id, 0):
+                markers[room_id] = message_id
+
+        if room_ids:
+            for room_id in room_ids:
+                markers.setdefault(room_id, 0)
+        return markers
+
+    def count_unread(self, db: Session, user_id: int, room_ids: Optional[List[str]] = None) -> List[dict]:
+        """Count unread messages per room, capped at UNREAD_COUNT_LIMIT."""
+        limit = settings.UNREAD_COUNT_LIMIT
+        markers = sorted(self.get_markers(db, user_id, room_ids).items())
+        counts = {}
+        for start in range(0, len(markers), UNREAD_ROOMS_PER_QUERY):
+            # One statement for all rooms, each branch a bounded range scan on
+            # (room_id, id) whose cost is at most `limit` index entries
+            branches = []
+            for room_id, last_read_id in markers[start:start + UNREAD_ROOMS_PER_QUERY]:
+                newer = (
+                    select(Message.id)
+                    .where(Message.room_id == room_id, Message.id > last_read_id)
+                    .limit(limit)
+                    .subquery()
+                )
+                branches.append(select(literal(room_id).label("room_id"), func.count().label("unread")).select_from(newer))
+            counts.update(db.execute(union_all(*branches)).all())
+        return [
+            {
+                "room_id": room_id,
+                "last_read_message_id": last_read_id or None,
+                "unread": counts[room_id],
+                "has_more": counts[room_id] >= limit,
+            }
+            for room_id, last_read_id in markers
+        ]
+
+read_markers = ReadMarkerBuffer()
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal, write_queue
+from app.models import Message, RoomStats
+
+ROOM_SORTS = ("activity", "messages", "name")
+
+logger = logging.getLogger(__name__)
+
+class PendingRoomStats:
+    """Room statistics changes that have not been written to the database yet."""
+
+    def __init__(self):
+        self.message_delta = 0
+        self.last_message_id: Optional[int] = None
+        self.last_message_at: Optional[datetime] = None
+        self.last_message_preview: Optional[str] = None
+        self.deleted_ids: List[int] = []
+        # Set when the newest unflushed message was deleted, the flush then re-reads the latest one
+        self.recompute_last = False
+
+def _room_summary(stats: RoomStats) -> dict:
+    return {
+        "room_id": stats.room_id,
+        "message_count": stats.message_count,
+        "last_message_id": stats.last_message_id,
+        "last_message_at": stats.last_message_at,
+        "last_message_preview": stats.last_message_preview,
+    }
+
+class RoomStatsTracker:
+    def __init__(self):
+        # Pending changes by room_id, merged into room_stats on every flush
+        self.pending: Dict[str, PendingRoomStats] = {}
+        self.lock = threading.Lock()
+
+    def _pending_for(self, room_id: str) -> PendingRoomStats:
+        pending = self.pending.get(room_id)
+        if pending is None:
+            pending = self.pending[room_id] = PendingRoomStats()
+        return pending
+
+    def record_message(self, message: Message):
+        """Account for a newly stored message."""
+        with self.lock:
+            pending = self._pending_for(message.room_id)
+            pending.message_delta += 1
+            if pending.last_message_id is None or message.id > pending.last_message_id:
+                pending.last_message_id = message.id
+                pending.last_message_at = message.created_at or datetime.utcnow()
+                pending.last_message_preview = message.content[:settings.ROOM_STATS_PREVIEW_LENGTH]
+
+    def record_delete(self, room_id: str, message_id: int):
+        """Account for a deleted message."""
+        with self.lock:
+            pending = self._pending_for(room_id)
+            pending.message_delta -= 1
+            pending.deleted_ids.append(message_id)
+            if pending.last_message_id == message_id:
+                pending.last_message_id = None
+                pending.last_message_at = None
+                pending.last_message_preview = None
+                pending.recompute_last = True
+
+    def _take_pending(self) -> Dict[str, PendingRoomStats]:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def _restore_pending(self, pending: Dict[str, PendingRoomStats]):
+        """Put back changes from a failed flush so they are retried."""
+        with self.lock:
+            for room_id, old in pending.items():
+                current = self.pending.get(room_id)
+                if current is None:
+                    self.pending[room_id] = old
+                    continue
+                current.message_delta += old.message_delta
+                current.deleted_ids = old.deleted_ids + current.deleted_ids
+                current.recompute_last = current.recompute_last or old.recompute_last
+                if current.last_message_id is None and old.last_message_id is not None:
+                    current.last_message_id = old.last_message_id
+                    current.last_message_at = old.last_message_at
+                    current.last_message_preview = old.last_message_preview
+
+    def _apply(self, db: Session, room_id: str, pending: PendingRoomStats):
+        stats = db.query(RoomStats).filter(RoomStats.room_id == room_id).with_for_update().first()
+        if stats is None:
+            stats = RoomStats(room_id=room_id, message_count=0)
+            db.add(stats)
+
+        stats.message_count = max((stats.message_count or 0) + pending.message_delta, 0)
+
+        if pending.last_message_id is not None:
+            if stats.last_message_id is None or pending.last_message_id > stats.last_message_id:
+                stats.last_message_id = pending.last_message_id
+                stats.last_message_at = pending.last_message_at
+                stats.last_message_preview = pending.last_message_preview
+        elif pending.recompute_last or stats.last_message_id in pending.deleted_ids:
+            # The newest message was deleted, fall back to the previous one
+            latest = (
+                db.query(Message)
+                .filter(Message.room_id == room_id)
+                .order_by(desc(Message.id))
+                .first()
+            )
+            stats.last_message_id = latest.id if latest else None
+            stats.last_message_at = latest.created_at if latest else None
+            stats.last_message_preview = latest.content[:settings.ROOM_STATS_PREVIEW_LENGTH] if latest else None
+
+    def flush(self):
+        """Write all pending changes to the room_stats table."""
+        pending = self._take_pending()
+        if not pending:
+            return
+
+        if write_queue is not None:
+            # On SQLite a read-then-write transaction fails if another write
+            # commits in between, so the updates go through the writer queue
+            try:
+                for room_id in list(pending):
+                    write_queue.run(lambda session: self._apply(session, room_id, pending[room_id]))
+                    del pending[room_id]
+            except Exception:
+                self._restore_pending(pending)
+                raise
+            return
+
+        db = SessionLocal()
+        try:
+            for room_id in list(pending):
+                try:
+                    self._apply(db, room_id, pending[room_id])
+                    db.commit()
+                except IntegrityError:
+                    # Another process created the row concurrently, retry as an update
+                    db.rollback()
+                    self._apply(db, room_id, pending[room_id])
+                    db.commit()
+                del pending[room_id]
+        except Exception:
+            db.rollback()
+            self._restore_pending(pending)
+            raise
+        finally:
+            db.close()
+
+    async def run_flusher(self, interval: float):
+        """Periodically flush pending changes until cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as e:
+                    logger.error("Room stats flush failed: %s", e)
+        finally:
+            await asyncio.to_thread(self.flush)
+
+    def get_last_message_id(self, db: Session, room_id: str) -> Optional[int]:
+        """Get the newest known message id of a room without scanning messages."""
+        with self.lock:
+            pending = self.pending.get(room_id)
+            pending_last_id = pending.last_message_id if pending else None
+        stored_last_id = (
+            db.query(RoomStats.last_message_id).filter(RoomStats.room_id == room_id).scalar()
+        )
+        return max((value for value in (pending_last_id, stored_last_id) if value is not None), default=None)
+
+    def list_rooms(self, db: Session, sort: str = "activity", skip: int = 0, limit: int = 50) -> List[dict]:
+        """List room statistics, including changes that are not flushed yet."""
+        query = db.query(RoomStats)
+        if sort == "messages":
+            query = query.order_by(desc(RoomStats.message_count), RoomStats.room_id)
+        elif sort == "name":
+            query = query.order_by(RoomStats.room_id)
+        else:
+            query = query.order_by(desc(RoomStats.last_message_at), RoomStats.room_id)
+
+        # Unflushed changes can move rooms across the page boundary, so merge
+        # them into the first skip + limit rows and cut the page afterwards
+        rooms = {stats.room_id: _room_summary(stats) for stats in query.limit(skip + limit).all()}
+
+        with self.lock:
+            pending = list(self.pending.items())
+
+        missing = [room_id for room_id, _ in pending if room_id not in rooms]
+        if missing:
+            for stats in db.query(RoomStats).filter(RoomStats.room_id.in_(missing)):
+                rooms[stats.room_id] = _room_summary(stats)
+
+        for room_id, room_pending in pending:
+            room = rooms.get(room_id)
+            if room is None:
+                if room_pending.last_message_id is None:
+                    continue
+                room = rooms[room_id] = {
+                    "room_id": room_id,
+                    "message_count": 0,
+                    "last_message_id": None,
+                    "last_message_at": None,
+                    "last_message_preview": None,
+                }
+            room["message_count"] = max(room["message_count"] + room_pending.message_delta, 0)
+            if room_pending.last_message_id is not None and (
+                room["last_message_id"] is None or room_pending.last_message_id > room["last_message_id"]
+            ):
+                room["last_message_id"] = room_pending.last_message_id
+                room["last_message_at"] = room_pending.last_message_at
+                room["last_message_preview"] = room_pending.last_message_preview
+
+        result = list(rooms.values())
+        if sort == "messages":
+            result.sort(key=lambda room: (-room["message_count"], room["room_id"]))
+        elif sort == "name":
+            result.sort(key=lambda room: room["room_id"])
+        else:
+            result.sort(key=lambda room: room["room_id"])
+            result.sort(key=lambda room: room["last_message_at"].timestamp() if room["last_message_at"] else 0, reverse=True)
+        return result[skip:skip + limit]
+
+room_stats = RoomStatsTracker()
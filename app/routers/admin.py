@@ -1,20 +1,46 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse, Response
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db, replica_session, SessionLocal
 from app.auth import require_admin, get_current_active_user
-from app.crud import get_users, get_user_by_id, delete_message
+from app.crud import get_users, get_user_by_id, delete_message, iter_users, iter_messages_by_room
+from app.crud import get_compression_samples, create_compression_dictionary
+from app.compression import compress, train_dictionary, dictionary_store
+from app.export import EXPORT_FORMATS, stream_export
+from app.admission import shed_load
+from app.profiling import profiler
+from app.config import settings
 from app.schemas import User
 from app.models import UserRole
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+USER_EXPORT_FIELDS = ["id", "username", "email", "role", "created_at"]
+MESSAGE_EXPORT_FIELDS = ["id", "room_id", "user_id", "username", "content", "created_at"]
+
+def _export_response(query_rows, fields: List[str], fmt: str, gzip: bool, filename: str) -> StreamingResponse:
+    """Build a streaming export response backed by its own database session."""
+    def generate():
+        # The request-scoped session may be closed before the body is fully
+        # sent, so the export owns a dedicated session for its lifetime
+        db = replica_session() or SessionLocal()
+        try:
+            yield from stream_export(query_rows(db), fields, fmt, compress=gzip)
+        finally:
+            db.close()
+    
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(generate(), media_type=EXPORT_FORMATS[fmt], headers=headers)
+
 @router.get("/users", response_model=List[User])
 def get_all_users(
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all users (admin only)."""
     users = get_users(db, skip=skip, limit=limit)
@@ -48,4 +74,119 @@ def admin_delete_message(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found"
         )
-    return {"message": "Message deleted successfully by admin"} 
\ No newline at end of file
+    return {"message": "Message deleted successfully by admin"} 
+
+@router.get("/export/users", dependencies=[Depends(shed_load)])
+def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    after_id: Optional[int] = None,
+    current_user: User = Depends(require_admin)
+):
+    """Stream all users as NDJSON or CSV (admin only)."""
+    return _export_response(
+        lambda db: iter_users(db, after_id=after_id),
+        USER_EXPORT_FIELDS,
+        format,
+        gzip,
+        "users"
+    )
+
+@router.get("/export/rooms/{room_id}/messages", dependencies=[Depends(shed_load)])
+def export_room_messages(
+    room_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    after_id: Optional[int] = None,
+    current_user: User = Depends(require_admin)
+):
+    """Stream the full message history of a room as NDJSON or CSV (admin only)."""
+    return _export_response(
+        lambda db: iter_messages_by_room(db, room_id, after_id=after_id),
+        MESSAGE_EXPORT_FIELDS,
+        format,
+        gzip,
+        f"room-{room_id}-messages"
+    )
+
+@router.post("/rooms/{room_id}/compression-dictionary")
+def train_compression_dictionary(
+    room_id: str,
+    samples: int = Query(1000, ge=10, le=10000),
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Train a zlib dictionary from a room's recent long messages and use it for new ones (admin only)."""
+    texts = get_compression_samples(db, room_id, limit=samples)
+    if len(texts) < 10:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least 10 compressed messages are needed to train a dictionary"
+        )
+    
+    # Measure on the newest fifth, which the dictionary is not trained on
+    holdout = texts[:len(texts) // 5]
+    data = train_dictionary(texts[len(holdout):])
+    original = sum(len(text.encode()) for text in holdout)
+    plain = sum(len(compress(text.encode())) for text in holdout)
+    primed = sum(len(compress(text.encode(), data)) for text in holdout)
+    if primed >= plain:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A dictionary does not improve compression for this room"
+        )
+    
+    dictionary = create_compression_dictionary(db, room_id, data, len(texts) - len(holdout))
+    dictionary_store.activate(room_id, dictionary.id, data)
+    return {
+        "dictionary_id": dictionary.id,
+        "room_id": room_id,
+        "size": len(data),
+        "sample_count": dictionary.sample_count,
+        "ratio": round(original / plain, 2),
+        "ratio_with_dictionary": round(original / primed, 2),
+    }
+
+@router.post("/profile")
+def start_profile(
+    seconds: float = Query(10, gt=0),
+    interval_ms: Optional[float] = Query(None, gt=0),
+    current_user: User = Depends(require_admin)
+):
+    """Start a time-boxed sampling profile of the whole process (admin only)."""
+    seconds = min(seconds, settings.PROFILE_MAX_SECONDS)
+    profile = profiler.start_session(seconds, (interval_ms or settings.PROFILE_INTERVAL_MS) / 1000)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profiling session is already running"
+        )
+    return profile.summary()
+
+@router.get("/profile")
+def list_profiles(current_user: User = Depends(require_admin)):
+    """List recorded profiles, including per-request and slow-handler captures (admin only)."""
+    return profiler.list()
+
+@router.get("/profile/{profile_id}")
+def download_profile(
+    profile_id: int,
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+    current_user: User = Depends(require_admin)
+):
+    """Download a profile as speedscope JSON or collapsed stacks (admin only)."""
+    profile = profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    if format == "collapsed":
+        content, media_type, extension = profile.to_collapsed(), "text/plain", "txt"
+    else:
+        content, media_type, extension = profile.to_speedscope(), "application/json", "speedscope.json"
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.{extension}"'}
+    )
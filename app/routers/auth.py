@@ -3,8 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.auth import create_access_token, authenticate_user, get_current_active_user
-from app.crud import create_user, get_user_by_username, get_user_by_email
+from app.auth import create_access_token, get_current_active_user
+from app.crud import create_user, get_user_by_username, get_user_by_email, authenticate_user
 from app.schemas import UserCreate, User, Token
 from app.config import settings
 
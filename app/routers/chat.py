@@ -1,21 +1,63 @@
 import json
-from typing import Optional
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, Query
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, Query, Request, Response, Header
+from fastapi.responses import JSONResponse
+from starlette.websockets import WebSocketState
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, track_queries, replica_session
 from app.auth import verify_token, get_current_active_user
-from app.crud import get_user_by_username, create_message, get_messages_by_room, delete_message
-from app.schemas import Message, MessageCreate, WebSocketMessage
-from app.websocket_manager import manager
+from app.crud import get_user_by_username, create_message_async, get_messages_by_room, delete_message, get_last_message_id
+from app.schemas import Message, MessageCreate, WebSocketMessage, RoomSummary, UnreadCount
+from app.websocket_manager import manager, EPHEMERAL_TYPES
+from app.room_stats import room_stats, ROOM_SORTS
+from app.read_markers import read_markers
+from app.history_cache import history_cache
+from app.config import settings
+from app.admission import shed_load
+from app.profiling import profiler
+from app.traffic_capture import traffic_recorder, CAPTURED_FRAME_TYPES
 from app.models import User
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+logger = logging.getLogger(__name__)
+
+def history_session(user_id: int, room_id: str, min_message_id: Optional[int] = None) -> Optional[Session]:
+    """Replica session for a history read, or None when the primary must serve it.
+
+    Writes are only tracked by the process that made them, so clients also
+    send the newest message id they wrote or saw; a replica that has not
+    replicated it yet would hide it, and the primary serves the read.
+    """
+    read_db = replica_session(user_id)
+    if read_db is not None and min_message_id and (get_last_message_id(read_db, room_id) or 0) < min_message_id:
+        read_db.close()
+        return None
+    return read_db
+
+def get_history_db(
+    room_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    x_min_message_id: Optional[int] = Header(None)
+):
+    """Session for history reads: the replica, unless it is unhealthy or behind this user's writes."""
+    read_db = history_session(current_user.id, room_id, x_min_message_id)
+    if read_db is None:
+        yield db
+        return
+    try:
+        yield read_db
+    finally:
+        read_db.close()
+
 @router.websocket("/ws/{room_id}")
 async def websocket_endpoint(
     websocket: WebSocket, 
     room_id: str,
-    token: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    min_message_id: Optional[int] = Query(None)
 ):
     """WebSocket endpoint for chat rooms with JWT authentication."""
     # Verify JWT token
@@ -28,6 +70,14 @@ async def websocket_endpoint(
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
+    # Refuse new connections over the admission limits so existing users stay responsive;
+    # checked before the database, whose checkout and lookup would block the event loop
+    rejection = manager.admission_rejection(room_id, token_data.username)
+    if rejection:
+        await websocket.accept()
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=rejection)
+        return
+    
     # Get database session
     db = next(get_db())
     
@@ -37,85 +87,177 @@ async def websocket_endpoint(
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
+    log_context = {"room_id": room_id, "user_id": user.id}
     try:
         # Connect to the room
         await manager.connect(websocket, room_id, user)
+        log_context["connection_id"] = manager.connection_users[websocket]["connection_id"]
         
         # Send recent messages to the newly connected user
-        await manager.send_recent_messages(websocket, db, room_id)
+        with track_queries("websocket connect"):
+            read_db = history_session(user.id, room_id, min_message_id)
+            try:
+                await manager.send_recent_messages(websocket, read_db or db, room_id)
+            finally:
+                if read_db is not None:
+                    read_db.close()
         
         # Handle incoming messages
         while True:
             try:
+                # Do not hold a read transaction while idle: on SQLite its
+                # snapshot would hide rows written through the writer queue
+                db.close()
+
                 # Receive message from client
                 data = await websocket.receive_text()
                 message_data = json.loads(data)
                 
+                if traffic_recorder.enabled:
+                    frame_type = message_data.get("type") or "message"
+                    traffic_recorder.record_frame(
+                        log_context["connection_id"],
+                        frame_type if frame_type in CAPTURED_FRAME_TYPES else "other",
+                        len(data)
+                    )
+                
+                # Read receipts only move the user's pointer, they are not stored as messages
+                if message_data.get("type") == "read":
+                    message_id = message_data.get("message_id")
+                    if isinstance(message_id, int) and message_id > 0:
+                        read_markers.mark_read(user.id, room_id, message_id)
+                    continue
+                
+                # Ephemeral signals such as typing indicators never touch the database
+                if message_data.get("type") in EPHEMERAL_TYPES:
+                    await manager.relay_ephemeral(websocket, message_data)
+                    continue
+                
+                # History paging reuses this connection's user and session
+                if message_data.get("type") == "fetch_history":
+                    with profiler.track("websocket fetch_history"), track_queries("websocket fetch_history"):
+                        min_id = message_data.get("min_message_id")
+                        read_db = history_session(user.id, room_id, min_id if isinstance(min_id, int) else None)
+                        try:
+                            await manager.send_history_page(websocket, read_db or db, room_id, message_data)
+                        finally:
+                            if read_db is not None:
+                                read_db.close()
+                    continue
+                
                 # Validate message structure
                 if "content" not in message_data or not message_data["content"].strip():
                     continue
                 
-                # Create message in database
-                db_message = create_message(
-                    db=db,
-                    message=MessageCreate(
-                        content=message_data["content"],
-                        room_id=room_id
-                    ),
-                    user_id=user.id
-                )
-                
-                # Broadcast message to all users in the room
-                ws_message = WebSocketMessage(
-                    type="message",
-                    content=db_message.content,
-                    room_id=room_id,
-                    user_id=user.id,
-                    username=user.username
-                )
-                await manager.broadcast_to_room(room_id, ws_message.dict())
+                with profiler.track("websocket message"), track_queries("websocket message"):
+                    # Create message in database
+                    db_message = await create_message_async(
+                        db=db,
+                        message=MessageCreate(
+                            content=message_data["content"],
+                            room_id=room_id
+                        ),
+                        user_id=user.id
+                    )
+                    
+                    # Broadcast message to all users in the room
+                    ws_message = WebSocketMessage(
+                        type="message",
+                        content=db_message.content,
+                        room_id=room_id,
+                        user_id=user.id,
+                        username=user.username,
+                        message_id=db_message.id
+                    )
+                    await manager.broadcast_to_room(room_id, ws_message.dict())
                 
             except json.JSONDecodeError:
                 # Invalid JSON, ignore
                 continue
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
+                if websocket.application_state != WebSocketState.CONNECTED:
+                    # Closed by the server while the frame was processed, e.g. drained on
+                    # shutdown; receiving again would fail at once instead of waiting
+                    raise WebSocketDisconnect(code=status.WS_1000_NORMAL_CLOSURE)
                 # Log error and continue
-                print(f"Error processing message: {e}")
+                logger.warning("Error processing message: %r", e, extra=log_context)
                 continue
                 
     except WebSocketDisconnect:
-        # Handle disconnect
+        # Handle disconnect, the leave is announced in the room's next presence_diff
         manager.disconnect(websocket)
-        
-        # Send leave notification to remaining users
-        if websocket in manager.connection_users:
-            user_info = manager.connection_users[websocket]
-            leave_message = WebSocketMessage(
-                type="leave",
-                content=f"{user_info['username']} left the room",
-                room_id=room_id,
-                username=user_info['username']
-            )
-            await manager.broadcast_to_room(room_id, leave_message.dict())
     except Exception as e:
         # Handle any other errors
-        print(f"WebSocket error: {e}")
+        logger.exception("WebSocket error: %r", e, extra=log_context)
         manager.disconnect(websocket)
     finally:
         db.close()
 
-@router.get("/messages/{room_id}", response_model=list[Message])
+@router.get("/rooms", response_model=list[RoomSummary], dependencies=[Depends(shed_load)])
+def list_rooms(
+    sort: str = Query("activity", pattern=f"^({'|'.join(ROOM_SORTS)})$"),
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """List rooms with message counts, last activity and connected users."""
+    rooms = room_stats.list_rooms(db, sort=sort, skip=skip, limit=limit)
+    for room in rooms:
+        room["active_users"] = manager.active_user_count(room["room_id"])
+    return rooms
+
+@router.get("/unread", response_model=list[UnreadCount], dependencies=[Depends(shed_load)])
+def get_unread_counts(
+    room_id: Optional[List[str]] = Query(None),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get unread message counts for the rooms the user has read markers in."""
+    return read_markers.count_unread(db, current_user.id, room_ids=room_id)
+
+@router.get("/messages/{room_id}", response_model=list[Message], dependencies=[Depends(shed_load)])
 def get_room_messages(
     room_id: str,
+    request: Request,
     skip: int = 0,
     limit: int = 50,
-    cursor: Optional[int] = None,
+    cursor: Optional[int] = Query(None, ge=1),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    history_db: Session = Depends(get_history_db)
 ):
     """Get messages for a specific room with pagination."""
-    messages = get_messages_by_room(db, room_id, skip=skip, limit=limit, cursor=cursor)
-    return messages
+    if cursor is None:
+        return get_messages_by_room(history_db, room_id, skip=skip, limit=limit, cursor=cursor)
+    
+    page = history_cache.get(room_id, cursor, skip, limit)
+    if page is None:
+        messages = get_messages_by_room(history_db, room_id, skip=skip, limit=limit, cursor=cursor)
+        
+        # Pages strictly below the newest message only change when a message in
+        # their range is deleted, so they can be cached and revalidated by ETag
+        last_message_id = room_stats.get_last_message_id(db, room_id)
+        if history_db is not db and last_message_id is not None:
+            # A lagging replica may miss the newest rows, only cache what it has caught up to
+            last_message_id = min(last_message_id, get_last_message_id(history_db, room_id) or 0)
+        if last_message_id is None or cursor > last_message_id + 1:
+            return messages
+        
+        body = JSONResponse([Message.model_validate(message).model_dump(mode="json") for message in messages]).body
+        lowest_id = messages[-1].id if len(messages) == limit else 0
+        page = history_cache.put(room_id, cursor, skip, limit, body, lowest_id)
+    
+    headers = {
+        "ETag": page.etag,
+        "Cache-Control": f"private, max-age={settings.HISTORY_CACHE_MAX_AGE}",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and page.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
 
 @router.delete("/messages/{message_id}")
 def delete_room_message(
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Union
 from datetime import datetime
 from app.models import UserRole
 
@@ -50,10 +50,59 @@ class Message(MessageBase):
     class Config:
         from_attributes = True
 
+# Room schemas
+class RoomSummary(BaseModel):
+    room_id: str
+    message_count: int
+    last_message_id: Optional[int] = None
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
+    active_users: int = 0
+
+class UnreadCount(BaseModel):
+    room_id: str
+    last_read_message_id: Optional[int] = None
+    unread: int
+    has_more: bool = False
+
 # WebSocket message schemas
 class WebSocketMessage(BaseModel):
-    type: str  # "message", "join", "leave"
+    type: str  # "message", "read"
     content: Optional[str] = None
     room_id: str
     user_id: Optional[int] = None
-    username: Optional[str] = None 
\ No newline at end of file
+    username: Optional[str] = None
+    message_id: Optional[int] = None 
+
+class EphemeralEvent(BaseModel):
+    type: str  # "typing"
+    room_id: str
+    user_id: int
+    username: str
+    state: Optional[str] = None
+
+class PresenceUser(BaseModel):
+    user_id: int
+    username: str
+
+class PresenceDiff(BaseModel):
+    type: str = "presence_diff"
+    room_id: str
+    joined: List[PresenceUser] = []
+    left: List[PresenceUser] = []
+
+class HistoryMessage(BaseModel):
+    message_id: int
+    content: str
+    user_id: int
+    username: str
+    created_at: Optional[datetime] = None
+
+class HistoryPage(BaseModel):
+    type: str = "history"
+    # Echoed back as sent, clients correlate with strings or numbers
+    request_id: Optional[Union[str, int]] = None
+    room_id: str
+    messages: List[HistoryMessage] = []
+    next_cursor: Optional[int] = None
+    error: Optional[str] = None
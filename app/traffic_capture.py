@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+CAPTURE_VERSION = 1
+
+# Frame types written as-is, anything else a client sends is recorded as "other"
+CAPTURED_FRAME_TYPES = {"message", "read", "typing", "fetch_history"}
+
+logger = logging.getLogger(__name__)
+
+class TrafficRecorder:
+    """Record anonymized WebSocket traffic to a gzip compressed JSON lines file.
+
+    The first line is a header object, every other line is a compact array:
+    ``[ms, "c", connection_id, room, user]`` for connects, ``[ms, "m",
+    connection_id, type, size]`` for received frames and ``[ms, "d",
+    connection_id]`` for disconnects. Rooms and users are salted hashes and
+    message content is never written, only its size.
+    """
+
+    def __init__(self):
+        self.events: Optional[queue.Queue] = None
+        self.thread: Optional[threading.Thread] = None
+        self.salt = b""
+        self.started = 0.0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.events is not None
+
+    def start(self, path: str, salt: str = "", queue_size: int = 100000):
+        """Start writing events to path; ``{pid}`` in the path is replaced by the process id."""
+        if self.enabled or not path:
+            return
+        path = path.replace("{pid}", str(os.getpid()))
+        # Without a configured salt hashes are only stable within one capture
+        self.salt = hashlib.blake2b(salt.encode(), digest_size=32).digest() if salt else os.urandom(32)
+        self.started = time.monotonic()
+        self.dropped = 0
+        self.events = queue.Queue(maxsize=queue_size)
+        header = {"version": CAPTURE_VERSION, "started_at": datetime.now(timezone.utc).isoformat()}
+        self.thread = threading.Thread(target=self._write, args=(path, header, self.events), name="traffic-capture", daemon=True)
+        self.thread.start()
+        logger.info("Recording WebSocket traffic to %s", path)
+
+    def stop(self):
+        """Write out queued events and close the capture file."""
+        if not self.enabled:
+            return
+        events, self.events = self.events, None
+        events.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.dropped:
+            logger.warning("Traffic capture dropped %d events", self.dropped)
+
+    def anonymize(self, value) -> str:
+        return hashlib.blake2b(str(value).encode(), key=self.salt, digest_size=6).hexdigest()
+
+    def _record(self, event: list):
+        events = self.events
+        if events is None:
+            return
+        event.insert(0, int((time.monotonic() - self.started) * 1000))
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_connect(self, connection_id: int, room_id: str, user_id: int):
+        if self.enabled:
+            self._record(["c", connection_id, self.anonymize(room_id), self.anonymize(user_id)])
+
+    def record_frame(self, connection_id: int, frame_type: str, size: int):
+        if self.enabled:
+            self._record(["m", connection_id, frame_type, size])
+
+    def record_disconnect(self, connection_id: int):
+        if self.enabled:
+            self._record(["d", connection_id])
+
+    def _write(self, path: str, header: dict, events: queue.Queue):
+        with gzip.open(path, "wt", encoding="utf-8") as capture:
+            capture.write(json.dumps(header) + "\n")
+            while True:
+                event = events.get()
+                if event is None:
+                    return
+                capture.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+def read_capture(path: str):
+    """Read a capture file, returning its header and the list of events."""
+    with gzip.open(path, "rt", encoding="utf-8") as capture:
+        header = json.loads(capture.readline())
+        if header.get("version") != CAPTURE_VERSION:
+            raise ValueError(f"Unsupported capture version: {header.get('version')}")
+        return header, [json.loads(line) for line in capture if line.strip()]
+
+traffic_recorder = TrafficRecorder()
@@ -1,11 +1,22 @@
+import asyncio
+import itertools
 import json
-from typing import Dict, List, Set
+import time
+from typing import Dict, List, Optional, Set, Tuple
 from fastapi import WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from app.models import User, Message
-from app.schemas import WebSocketMessage
-from app.crud import create_message, get_messages_by_room
+from app.schemas import WebSocketMessage, PresenceDiff, PresenceUser, HistoryPage, HistoryMessage, EphemeralEvent
+from app.crud import create_message, get_messages_by_room, get_history_page
+from app.compression import decode_content
 from app.auth import verify_token
+from app.admission import websocket_rejection, load_monitor
+from app.config import settings
+from app.traffic_capture import traffic_recorder
+
+# Frame types that are only fanned out to the room and never stored, with their valid states
+EPHEMERAL_STATES = {"typing": {"start", "stop"}}
+EPHEMERAL_TYPES = set(EPHEMERAL_STATES)
 
 class ConnectionManager:
     def __init__(self):
@@ -13,6 +24,21 @@ class ConnectionManager:
         self.active_connections: Dict[str, List[WebSocket]] = {}
         # Store user info for each connection
         self.connection_users: Dict[WebSocket, Dict] = {}
+        # Number of open connections per username, the token subject checked at admission
+        self.user_connection_counts: Dict[str, int] = {}
+        # Process-local ids identifying connections in logs
+        self.connection_ids = itertools.count(1)
+        # Open connections per user_id within each room
+        self.room_user_counts: Dict[str, Dict[int, int]] = {}
+        # Presence changes waiting for the next presence_diff frame, by room_id
+        self.pending_joins: Dict[str, Dict[int, str]] = {}
+        self.pending_leaves: Dict[str, Dict[int, str]] = {}
+        self.presence_flushes: Dict[str, asyncio.Task] = {}
+        # Ephemeral relays per (user_id, room_id, type): (start of the debounce window,
+        # last relayed state, whether the window's early state change was used)
+        self.ephemeral_sent: Dict[Tuple[int, str, str], Tuple[float, str, bool]] = {}
+        # Set while shutting down, new connections are refused
+        self.draining = False
     
     async def connect(self, websocket: WebSocket, room_id: str, user: User):
         """Connect a user to a room."""
@@ -25,25 +51,23 @@ class ConnectionManager:
         self.connection_users[websocket] = {
             "user_id": user.id,
             "username": user.username,
-            "room_id": room_id
+            "room_id": room_id,
+            "connection_id": next(self.connection_ids)
         }
+        self.user_connection_counts[user.username] = self.user_connection_counts.get(user.username, 0) + 1
+        traffic_recorder.record_connect(self.connection_users[websocket]["connection_id"], room_id, user.id)
         
-        # Send join notification
-        join_message = WebSocketMessage(
-            type="join",
-            content=f"{user.username} joined the room",
-            room_id=room_id,
-            user_id=user.id,
-            username=user.username
-        )
-        await self.broadcast_to_room(room_id, join_message.dict())
+        # Only a user's first connection to the room changes presence
+        room_users = self.room_user_counts.setdefault(room_id, {})
+        room_users[user.id] = room_users.get(user.id, 0) + 1
+        if room_users[user.id] == 1:
+            self.queue_presence(room_id, user.id, user.username, joined=True)
     
     def disconnect(self, websocket: WebSocket):
         """Disconnect a user from a room."""
         if websocket in self.connection_users:
             user_info = self.connection_users[websocket]
             room_id = user_info["room_id"]
-            username = user_info["username"]
             
             # Remove from active connections
             if room_id in self.active_connections:
@@ -53,28 +77,108 @@ class ConnectionManager:
             
             # Remove user info
             del self.connection_users[websocket]
+            traffic_recorder.record_disconnect(user_info["connection_id"])
+            user_id = user_info["user_id"]
+            username = user_info["username"]
+            self.user_connection_counts[username] -= 1
+            if not self.user_connection_counts[username]:
+                del self.user_connection_counts[username]
             
-            # Send leave notification
-            leave_message = WebSocketMessage(
-                type="leave",
-                content=f"{username} left the room",
-                room_id=room_id,
-                username=username
-            )
-            # Note: We can't broadcast here as the connection is already closed
-            # This would need to be handled by the calling function
+            # Only a user's last connection to the room changes presence
+            room_users = self.room_user_counts.get(room_id, {})
+            room_users[user_id] = room_users.get(user_id, 1) - 1
+            if room_users[user_id] <= 0:
+                del room_users[user_id]
+                if not room_users:
+                    self.room_user_counts.pop(room_id, None)
+                for event_type in EPHEMERAL_TYPES:
+                    self.ephemeral_sent.pop((user_id, room_id, event_type), None)
+                self.queue_presence(room_id, user_id, user_info["username"], joined=False)
+    
+    def queue_presence(self, room_id: str, user_id: int, username: str, joined: bool):
+        """Record a join or leave for the room's next coalesced presence_diff frame."""
+        # Above the size limit presence is not announced at all, clients use /chat/rooms
+        if settings.PRESENCE_MAX_ROOM_SIZE and len(self.active_connections.get(room_id, [])) > settings.PRESENCE_MAX_ROOM_SIZE:
+            return
+        
+        joins = self.pending_joins.setdefault(room_id, {})
+        leaves = self.pending_leaves.setdefault(room_id, {})
+        # A join and a leave of the same user inside one window cancel out
+        if joined:
+            if leaves.pop(user_id, None) is None:
+                joins[user_id] = username
+        elif joins.pop(user_id, None) is None:
+            leaves[user_id] = username
+        
+        self._schedule_presence_flush(room_id)
+    
+    def _schedule_presence_flush(self, room_id: str):
+        if room_id in self.presence_flushes:
+            return
+        self.presence_flushes[room_id] = asyncio.get_running_loop().create_task(
+            self._flush_presence_later(room_id)
+        )
+    
+    async def _flush_presence_later(self, room_id: str):
+        await asyncio.sleep(settings.PRESENCE_COALESCE_WINDOW)
+        await self.flush_presence(room_id)
+    
+    async def flush_presence(self, room_id: str):
+        """Broadcast the coalesced joins and leaves of a room as one frame."""
+        self.presence_flushes.pop(room_id, None)
+        joins = self.pending_joins.pop(room_id, {})
+        leaves = self.pending_leaves.pop(room_id, {})
+        if not joins and not leaves:
+            return
+        
+        presence_diff = PresenceDiff(
+            room_id=room_id,
+            joined=[PresenceUser(user_id=user_id, username=username) for user_id, username in joins.items()],
+            left=[PresenceUser(user_id=user_id, username=username) for user_id, username in leaves.items()]
+        )
+        await self.broadcast_to_room(room_id, presence_diff.dict())
+    
+    def admission_rejection(self, room_id: str, username: str) -> Optional[str]:
+        """Check the admission limits for a new connection of a user to a room."""
+        if self.draining:
+            return "Server restarting"
+        return websocket_rejection(
+            len(self.connection_users),
+            len(self.active_connections.get(room_id, [])),
+            self.user_connection_counts.get(username, 0)
+        )
+    
+    async def drain(self, code: int, reason: str, timeout: float):
+        """Close every connection with a reconnect code and wait for their handlers to finish."""
+        self.draining = True
+        await asyncio.gather(
+            *(websocket.close(code=code, reason=reason) for websocket in list(self.connection_users)),
+            return_exceptions=True
+        )
+        # Handlers finish the frame they are processing before they see the close
+        deadline = time.monotonic() + timeout
+        while self.connection_users and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+    
+    def active_user_count(self, room_id: str) -> int:
+        """Count distinct users connected to a room."""
+        return len(self.room_user_counts.get(room_id, {}))
     
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """Send a message to a specific connection."""
         await websocket.send_text(message)
     
-    async def broadcast_to_room(self, room_id: str, message: dict):
+    async def broadcast_to_room(self, room_id: str, message: dict, exclude_user_id: Optional[int] = None):
         """Broadcast a message to all connections in a room."""
         if room_id in self.active_connections:
+            # Encode once for the whole room instead of once per connection
+            text = json.dumps(message)
             disconnected = []
-            for connection in self.active_connections[room_id]:
+            for connection in list(self.active_connections[room_id]):
+                if exclude_user_id is not None and self.connection_users.get(connection, {}).get("user_id") == exclude_user_id:
+                    continue
                 try:
-                    await connection.send_text(json.dumps(message))
+                    await connection.send_text(text)
                 except:
                     disconnected.append(connection)
             
@@ -82,6 +186,40 @@ class ConnectionManager:
             for connection in disconnected:
                 self.disconnect(connection)
     
+    async def relay_ephemeral(self, websocket: WebSocket, event: dict):
+        """Fan out an ephemeral event to the other users in the room, debounced per user."""
+        # Use the connection's cached identity, the ORM user may be expired after a commit
+        user_info = self.connection_users.get(websocket)
+        if user_info is None:
+            return
+        room_id = user_info["room_id"]
+        user_id = user_info["user_id"]
+        event_type = event["type"]
+        state = event.get("state")
+        if state not in EPHEMERAL_STATES[event_type]:
+            return
+        
+        # At most one relay per debounce window, plus one early state change
+        # (e.g. typing stopped) so the room does not wait for the window to end
+        key = (user_id, room_id, event_type)
+        now = time.monotonic()
+        last = self.ephemeral_sent.get(key)
+        if last is None or now - last[0] >= settings.EPHEMERAL_DEBOUNCE:
+            self.ephemeral_sent[key] = (now, state, False)
+        elif state != last[1] and not last[2]:
+            self.ephemeral_sent[key] = (last[0], state, True)
+        else:
+            return
+        
+        ephemeral_event = EphemeralEvent(
+            type=event_type,
+            room_id=room_id,
+            user_id=user_id,
+            username=user_info["username"],
+            state=state
+        )
+        await self.broadcast_to_room(room_id, ephemeral_event.dict(), exclude_user_id=user_id)
+    
     async def send_recent_messages(self, websocket: WebSocket, db: Session, room_id: str, limit: int = 50):
         """Send recent messages to a newly connected user."""
         messages = get_messages_by_room(db, room_id, limit=limit)
@@ -92,8 +230,41 @@ class ConnectionManager:
                 content=message.content,
                 room_id=room_id,
                 user_id=message.user_id,
-                username=message.user.username
+                username=message.user.username,
+                message_id=message.id
             )
             await self.send_personal_message(json.dumps(ws_message.dict()), websocket)
+    
+    async def send_history_page(self, websocket: WebSocket, db: Session, room_id: str, request: dict):
+        """Answer a fetch_history frame with one page of older messages."""
+        request_id = request.get("request_id")
+        cursor = request.get("cursor")
+        limit = request.get("limit", 50)
+        if request_id is not None and (not isinstance(request_id, (str, int)) or isinstance(request_id, bool)):
+            page = HistoryPage(room_id=room_id, error="request_id must be a string or an integer")
+        elif (cursor is not None and not isinstance(cursor, int)) or not isinstance(limit, int):
+            page = HistoryPage(request_id=request_id, room_id=room_id, error="cursor and limit must be integers")
+        elif load_monitor.overload_reason():
+            page = HistoryPage(request_id=request_id, room_id=room_id, error="Server overloaded, try again later")
+        else:
+            limit = max(1, min(limit, settings.WS_HISTORY_MAX_LIMIT))
+            rows = get_history_page(db, room_id, cursor=cursor, limit=limit)
+            page = HistoryPage(
+                request_id=request_id,
+                room_id=room_id,
+                messages=[
+                    HistoryMessage(
+                        message_id=id,
+                        content=decode_content(content, compressed_content, dictionary_id),
+                        user_id=user_id,
+                        username=username,
+                        created_at=created_at
+                    )
+                    for id, content, compressed_content, dictionary_id, user_id, username, created_at in rows
+                ],
+                # A short page means the start of the room was reached
+                next_cursor=rows[-1][0] if len(rows) == limit else None
+            )
+        await self.send_personal_message(page.json(), websocket)
 
 manager = ConnectionManager() 
\ No newline at end of file
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Message body compression benchmark: storage ratio and CPU cost of writing
+and reading compressed messages, with and without a trained room dictionary
+
+Usage:
+    python benchmarks/compression_benchmark.py
+    DATABASE_URL=postgresql://... python benchmarks/compression_benchmark.py --room general
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.compression import compress, decompress, train_dictionary
+from app.config import settings
+
+SERVICES = ["api", "worker", "scheduler", "billing", "gateway"]
+ERRORS = [
+    "ConnectionRefusedError: [Errno 111] Connection refused",
+    "TimeoutError: upstream request timed out after 30s",
+    "KeyError: 'user_id'",
+    "sqlalchemy.exc.OperationalError: (psycopg2.OperationalError) server closed the connection unexpectedly",
+]
+CODE = '''def {name}(db: Session, room_id: str, limit: int = {limit}) -> List[Message]:
+    """Get the latest messages of a room."""
+    query = db.query(Message).filter(Message.room_id == room_id)
+    if limit > {cap}:
+        raise ValueError("limit must be at most {cap}")
+    return query.order_by(desc(Message.id)).limit(limit).all()
+'''
+
+def pasted_log(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(5, 60)):
+        lines.append(
+            f"2026-10-19T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}.{rng.randint(0, 999):03d}Z "
+            f"{rng.choice(['INFO', 'WARNING', 'ERROR'])} {rng.choice(SERVICES)}-{rng.randint(1, 8)} "
+            f"request_id={rng.getrandbits(64):016x} {rng.choice(ERRORS)}"
+        )
+    return "\n".join(lines)
+
+def pasted_code(rng: random.Random) -> str:
+    return "\n".join(
+        CODE.format(name=f"get_{rng.choice(SERVICES)}_messages_{i}", limit=rng.choice([20, 50, 100]), cap=rng.choice([200, 500]))
+        for i in range(rng.randint(1, 6))
+    )
+
+def chat_line(rng: random.Random) -> str:
+    words = ["deploy", "looks", "good", "can", "you", "check", "the", "logs", "again", "thanks", "on", "it", "now"]
+    return " ".join(rng.choice(words) for _ in range(rng.randint(2, 25)))
+
+def synthetic_corpus(count: int, seed: int) -> list:
+    """Mostly short chat lines with pasted logs and code, like our busiest rooms."""
+    rng = random.Random(seed)
+    generators = [chat_line] * 6 + [pasted_log] * 3 + [pasted_code]
+    return [rng.choice(generators)(rng) for _ in range(count)]
+
+def room_corpus(room_id: str, count: int) -> list:
+    """Read the newest messages of a room from DATABASE_URL."""
+    from app.database import SessionLocal
+    from app.crud import get_messages_by_room
+    db = SessionLocal()
+    try:
+        return [message.content for message in reversed(get_messages_by_room(db, room_id, limit=count))]
+    finally:
+        db.close()
+
+def measure(bodies: list, threshold: int, dictionary=None) -> dict:
+    """Store bodies the way app.compression.encode_content does and time both directions."""
+    raw = stored = compressed = 0
+    blobs = []
+    started = time.process_time()
+    for data in bodies:
+        raw += len(data)
+        if threshold and len(data) >= threshold:
+            blob = compress(data, dictionary)
+            if len(blob) <= len(data) * 0.9:
+                blobs.append(blob)
+                stored += len(blob)
+                compressed += 1
+                continue
+        stored += len(data)
+    write_seconds = time.process_time() - started
+
+    decompressed = 0
+    started = time.process_time()
+    for blob in blobs:
+        decompressed += len(decompress(blob, dictionary))
+    read_seconds = time.process_time() - started
+    return {
+        "raw": raw,
+        "stored": stored,
+        "compressed": compressed,
+        "write_us": write_seconds / len(bodies) * 1e6,
+        "read_us": read_seconds / max(len(blobs), 1) * 1e6,
+        "read_mb_s": decompressed / read_seconds / 1e6 if read_seconds else 0.0,
+    }
+
+def report(label: str, result: dict, count: int):
+    print(
+        f"{label:<18} ratio {result['raw'] / result['stored']:5.2f}  "
+        f"stored {result['stored'] / 1024:9.1f} KiB of {result['raw'] / 1024:9.1f} KiB  "
+        f"compressed {result['compressed']:6d}/{count}  "
+        f"write {result['write_us']:7.2f} us/msg  read {result['read_us']:7.2f} us/compressed msg ({result['read_mb_s']:.0f} MB/s)"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--room", help="benchmark a room's newest messages from DATABASE_URL instead of a synthetic corpus")
+    parser.add_argument("--threshold", type=int, default=settings.MESSAGE_COMPRESSION_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    texts = room_corpus(args.room, args.messages) if args.room else synthetic_corpus(args.messages, args.seed)
+    if not texts:
+        parser.error("no messages to benchmark")
+    bodies = [text.encode() for text in texts]
+    # Train on the older half and measure on the newer half, as a room would
+    half = len(bodies) // 2
+    train, test = texts[:half], bodies[half:]
+    dictionary = train_dictionary([text for text in train if len(text.encode()) >= args.threshold])
+
+    print(f"corpus:            {args.room or 'synthetic'}, {len(test)} messages measured, threshold {args.threshold} bytes, zlib level {settings.MESSAGE_COMPRESSION_LEVEL}")
+    print(f"dictionary:        {len(dictionary)} bytes trained on {half} messages")
+    report("zlib", measure(test, args.threshold), len(test))
+    report("zlib + dictionary", measure(test, args.threshold, dictionary), len(test))
+
+if __name__ == "__main__":
+    main()
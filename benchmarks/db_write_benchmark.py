@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Concurrent message write/read benchmark against the configured DATABASE_URL
+
+Usage:
+    DATABASE_URL=sqlite:///./bench.db python benchmarks/db_write_benchmark.py
+    DATABASE_URL=postgresql://... python benchmarks/db_write_benchmark.py
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crud
+from app.database import SessionLocal, engine
+from app.models import Base, User
+from app.schemas import MessageCreate
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+def setup_user() -> int:
+    """Create the benchmark tables and user."""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "bench").first()
+        if user is None:
+            user = User(username="bench", email="bench@example.com", hashed_password="x")
+            db.add(user)
+            db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def writer(user_id: int, room_id: str, count: int, latencies: list, errors: list):
+    db = SessionLocal()
+    try:
+        for i in range(count):
+            started = time.perf_counter()
+            try:
+                crud.create_message(db, MessageCreate(content=f"benchmark message {i}", room_id=room_id), user_id)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                db.rollback()
+                errors.append(repr(e))
+    finally:
+        db.close()
+
+async def async_writers(user_id: int, rooms: int, writers: int, count: int, latencies: list, errors: list):
+    """Write from coroutines on one event loop, the way WebSocket handlers do."""
+    async def write(room_id: str):
+        db = SessionLocal()
+        try:
+            for i in range(count):
+                started = time.perf_counter()
+                try:
+                    await crud.create_message_async(db, MessageCreate(content=f"benchmark message {i}", room_id=room_id), user_id)
+                    latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    db.rollback()
+                    errors.append(repr(e))
+        finally:
+            db.close()
+
+    await asyncio.gather(*(write(f"bench-{i % rooms}") for i in range(writers)))
+
+def reader(room_id: str, interval: float, stop: threading.Event, latencies: list, errors: list):
+    db = SessionLocal()
+    try:
+        while not stop.wait(interval):
+            started = time.perf_counter()
+            try:
+                crud.get_messages_by_room(db, room_id, limit=50)
+                db.rollback()
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                db.rollback()
+                errors.append(repr(e))
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=200, help="messages per writer")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--read-interval", type=float, default=0.005, help="seconds between reads of each reader")
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--no-writer-queue", action="store_true", help="commit SQLite inserts directly from each thread")
+    parser.add_argument("--async-writers", action="store_true", help="write from coroutines on one event loop instead of threads")
+    args = parser.parse_args()
+
+    if args.no_writer_queue:
+        crud.write_queue = None
+
+    user_id = setup_user()
+    write_latencies, read_latencies, errors = [], [], []
+    stop = threading.Event()
+
+    readers = [
+        threading.Thread(target=reader, args=(f"bench-{i % args.rooms}", args.read_interval, stop, read_latencies, errors))
+        for i in range(args.readers)
+    ]
+    if args.async_writers:
+        writers = [threading.Thread(
+            target=asyncio.run,
+            args=(async_writers(user_id, args.rooms, args.writers, args.messages, write_latencies, errors),)
+        )]
+    else:
+        writers = [
+            threading.Thread(target=writer, args=(user_id, f"bench-{i % args.rooms}", args.messages, write_latencies, errors))
+            for i in range(args.writers)
+        ]
+
+    started = time.perf_counter()
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    print(f"database:      {engine.dialect.name}{' (writer queue off)' if engine.dialect.name == 'sqlite' and crud.write_queue is None else ''}")
+    print(f"writers:       {args.writers} {'coroutines' if args.async_writers else 'threads'} x {args.messages} messages, {args.readers} readers")
+    print(f"inserts/s:     {len(write_latencies) / elapsed:.0f}")
+    print(f"write p50/p99: {statistics.median(write_latencies) * 1000 if write_latencies else 0:.2f} / {percentile(write_latencies, 0.99) * 1000:.2f} ms")
+    print(f"reads/s:       {len(read_latencies) / elapsed:.0f}")
+    print(f"read p50/p99:  {statistics.median(read_latencies) * 1000 if read_latencies else 0:.2f} / {percentile(read_latencies, 0.99) * 1000:.2f} ms")
+    print(f"errors:        {len(errors)}{' (' + errors[0] + ')' if errors else ''}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Replay a WebSocket traffic capture against a running instance and report
+delivery latency and errors
+
+Record a capture by starting the server with TRAFFIC_CAPTURE_PATH set, then:
+
+Usage:
+    python benchmarks/replay_traffic.py capture.jsonl.gz --url http://127.0.0.1:8000 --speed 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+import websockets
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.traffic_capture import read_capture
+
+# Overhead of {"content": ""} in a recorded chat frame
+CONTENT_FRAME_OVERHEAD = len(json.dumps({"content": ""}))
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+def group_connections(events, max_seconds=None):
+    """Group capture events by connection, in connect order."""
+    connections = {}
+    for event in events:
+        at, kind, connection_id = event[0] / 1000, event[1], event[2]
+        if max_seconds is not None and at > max_seconds:
+            break
+        if kind == "c":
+            connections[connection_id] = {"at": at, "room": event[3], "user": event[4], "events": []}
+        elif connection_id in connections:
+            connections[connection_id]["events"].append((at, kind, event[3:]))
+    return list(connections.values())
+
+def post(url, data, as_json):
+    if as_json:
+        body, content_type = json.dumps(data).encode(), "application/json"
+    else:
+        body, content_type = urllib.parse.urlencode(data).encode(), "application/x-www-form-urlencoded"
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+def login(base_url, username, password):
+    """Sign up a replay user if needed and return an access token."""
+    try:
+        post(f"{base_url}/auth/signup", {"username": username, "email": f"{username}@replay.example.com", "password": password}, True)
+    except urllib.error.HTTPError as e:
+        # 400 means the user exists from an earlier replay
+        if e.code != 400:
+            raise
+    return post(f"{base_url}/auth/login", {"username": username, "password": password}, False)["access_token"]
+
+class Replay:
+    def __init__(self, args, connections):
+        self.args = args
+        self.connections = connections
+        self.ws_url = args.url.replace("http", "ws", 1).rstrip("/")
+        # Tags delivered messages so history from earlier runs is not counted
+        self.run_id = f"{os.getpid():x}{int(time.time()):x}"
+        self.tokens = {}
+        self.sent_at = {}
+        self.delivered = set()
+        self.latencies = []
+        self.schedule_lag = []
+        self.sent = Counter()
+        self.received = Counter()
+        self.errors = Counter()
+        self.connected = 0
+        self.started = 0.0
+
+    async def login_users(self):
+        semaphore = asyncio.Semaphore(8)
+
+        async def login_user(user):
+            async with semaphore:
+                try:
+                    username = f"{self.args.user_prefix}_{user}"
+                    self.tokens[user] = await asyncio.to_thread(login, self.args.url.rstrip("/"), username, self.args.password)
+                except Exception as e:
+                    self.errors[f"login: {e!r}"] += 1
+
+        await asyncio.gather(*(login_user(user) for user in {c["user"] for c in self.connections}))
+
+    async def wait_until(self, at):
+        """Sleep until a capture timestamp, scaled by the replay speed."""
+        delay = self.started + at / self.args.speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            self.schedule_lag.append(-delay)
+
+    def build_frame(self, frame_type, size, state):
+        if frame_type == "message":
+            seq = len(self.sent_at)
+            marker = f"replay {self.run_id}:{seq} "
+            content = marker + "x" * max(size - CONTENT_FRAME_OVERHEAD - len(marker), 0)
+            self.sent_at[seq] = time.perf_counter()
+            return {"content": content}
+        if frame_type == "read":
+            return {"type": "read", "message_id": state["last_message_id"] or 1}
+        if frame_type == "typing":
+            return {"type": "typing", "state": "start"}
+        if frame_type == "fetch_history":
+            return {"type": "fetch_history", "request_id": str(self.sent[frame_type]), "limit": 50}
+        return None
+
+    def handle_frame(self, raw, state):
+        received_at = time.perf_counter()
+        try:
+            frame = json.loads(raw)
+        except ValueError:
+            self.errors["invalid frame"] += 1
+            return
+        frame_type = frame.get("type", "other")
+        self.received[frame_type] += 1
+        if frame_type == "history" and frame.get("error"):
+            self.errors[f"history: {frame['error']}"] += 1
+        if frame_type != "message":
+            return
+        state["last_message_id"] = max(state["last_message_id"], frame.get("message_id") or 0)
+        prefix = f"replay {self.run_id}:"
+        content = frame.get("content", "")
+        if content.startswith(prefix):
+            seq = int(content[len(prefix):].split(" ", 1)[0])
+            if seq in self.sent_at:
+                self.latencies.append(received_at - self.sent_at[seq])
+                self.delivered.add(seq)
+
+    async def receive(self, websocket, state):
+        try:
+            async for raw in websocket:
+                self.handle_frame(raw, state)
+        except websockets.ConnectionClosed:
+            pass
+        if websocket.close_code not in (1000, 1001) and not state["closing"]:
+            self.errors[f"closed by server: {websocket.close_code} {websocket.close_reason}".strip()] += 1
+
+    async def play_connection(self, connection, end):
+        await self.wait_until(connection["at"])
+        token = self.tokens.get(connection["user"])
+        if token is None:
+            self.errors["no token"] += 1
+            return
+        url = f"{self.ws_url}/chat/ws/{self.args.room_prefix}{connection['room']}?token={token}"
+        try:
+            websocket = await websockets.connect(url, open_timeout=self.args.timeout, max_size=None)
+        except Exception as e:
+            self.errors[f"connect: {type(e).__name__}"] += 1
+            return
+        self.connected += 1
+        state = {"last_message_id": 0, "closing": False}
+        receiver = asyncio.create_task(self.receive(websocket, state))
+        disconnected = False
+        try:
+            for at, kind, fields in connection["events"]:
+                await self.wait_until(at)
+                if kind == "d":
+                    disconnected = True
+                    break
+                frame = self.build_frame(fields[0], fields[1], state)
+                if frame is None:
+                    continue
+                await websocket.send(json.dumps(frame))
+                self.sent[fields[0]] += 1
+            else:
+                # Still open when the capture ended
+                await self.wait_until(end)
+        except websockets.ConnectionClosed:
+            pass
+        except Exception as e:
+            self.errors[f"send: {type(e).__name__}"] += 1
+        # Give in-flight deliveries time to arrive before closing
+        if not disconnected:
+            await asyncio.sleep(self.args.drain)
+        state["closing"] = True
+        await websocket.close()
+        await receiver
+
+    async def run(self):
+        await self.login_users()
+        end = max([c["at"] for c in self.connections] + [e[0] for c in self.connections for e in c["events"]], default=0)
+        self.started = time.perf_counter()
+        await asyncio.gather(*(self.play_connection(connection, end) for connection in self.connections))
+        return time.perf_counter() - self.started, end
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="capture file written with TRAFFIC_CAPTURE_PATH")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier, 1 to 50")
+    parser.add_argument("--max-seconds", type=float, help="only replay the first seconds of the capture")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to keep sockets open for deliveries at the end")
+    parser.add_argument("--timeout", type=float, default=10.0, help="WebSocket connect timeout")
+    parser.add_argument("--user-prefix", default="replay")
+    parser.add_argument("--room-prefix", default="replay-")
+    parser.add_argument("--password", default="replay-password")
+    args = parser.parse_args()
+    if not 1 <= args.speed <= 50:
+        parser.error("--speed must be between 1 and 50")
+
+    header, events = read_capture(args.capture)
+    connections = group_connections(events, args.max_seconds)
+    replay = Replay(args, connections)
+    elapsed, duration = asyncio.run(replay.run())
+
+    latencies = replay.latencies
+    print(f"capture:           {args.capture} (started {header['started_at']}, {duration:.1f}s)")
+    print(f"replay:            {args.speed:g}x in {elapsed:.1f}s")
+    print(f"connections:       {replay.connected} / {len(connections)} opened, {len(replay.tokens)} users")
+    print(f"frames sent:       {sum(replay.sent.values())} ({', '.join(f'{k} {v}' for k, v in sorted(replay.sent.items()))})")
+    print(f"frames received:   {sum(replay.received.values())} ({', '.join(f'{k} {v}' for k, v in sorted(replay.received.items()))})")
+    print(f"deliveries:        {len(latencies)}, {len(replay.sent_at) - len(replay.delivered)} messages never delivered")
+    print(f"latency p50/p99:   {statistics.median(latencies) * 1000 if latencies else 0:.2f} / {percentile(latencies, 0.99) * 1000:.2f} ms (max {max(latencies, default=0) * 1000:.2f} ms)")
+    print(f"schedule lag p99:  {percentile(replay.schedule_lag, 0.99) * 1000:.2f} ms")
+    print(f"errors:            {sum(replay.errors.values())}")
+    for error, count in replay.errors.most_common(10):
+        print(f"  {count:6d}  {error}")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,102 @@
 #!/usr/bin/env python3
 """
 Startup script for the Chat Application
+
+    python run.py                 # development server, reloads when DEBUG=True
+    python run.py --production    # uvloop/httptools, graceful drain, one worker unless WEB_CONCURRENCY/--workers
 """
+import argparse
+import importlib.util
+import logging
+import os
 import uvicorn
+from uvicorn.supervisors import Multiprocess
 from app.config import settings
 
-if __name__ == "__main__":
-    uvicorn.run(
+# Tells WebSocket clients the server is restarting and they should reconnect
+WS_CLOSE_SERVICE_RESTART = 1012
+
+logger = logging.getLogger("uvicorn.error")
+
+class DrainingServer(uvicorn.Server):
+    """Uvicorn server that closes WebSockets with 1012 before shutting down.
+
+    Uvicorn would drop open WebSockets abruptly; draining first lets each
+    handler finish the frame it is processing, and the lifespan shutdown
+    then flushes buffered writes.
+    """
+
+    async def shutdown(self, sockets=None):
+        # Stop accepting first so reconnecting clients land on another instance
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+
+        # Imported here so the supervisor process does not load the application
+        from app.websocket_manager import manager
+        if manager.connection_users:
+            logger.info("Draining %d WebSocket connections", len(manager.connection_users))
+        await manager.drain(WS_CLOSE_SERVICE_RESTART, "Server restarting", settings.SHUTDOWN_DRAIN_TIMEOUT)
+        await super().shutdown(sockets)
+
+def worker_count() -> int:
+    if settings.DATABASE_URL.startswith("sqlite"):
+        # The SQLite writer queue serializes writes within one process only
+        return 1
+    return max(settings.WEB_CONCURRENCY, 1)
+
+def run_production(workers: int):
+    config = uvicorn.Config(
         "app.main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.DEBUG,
+        workers=workers,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        ws="websockets",
+        ws_max_size=settings.WS_MAX_SIZE,
+        ws_ping_interval=settings.WS_PING_INTERVAL,
+        ws_ping_timeout=settings.WS_PING_TIMEOUT,
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
+        timeout_graceful_shutdown=int(settings.SHUTDOWN_DRAIN_TIMEOUT),
+        proxy_headers=True,
+        access_log=False,
         log_level="info"
-    ) 
\ No newline at end of file
+    )
+    if "SECRET_KEY" not in os.environ:
+        # Workers would each generate their own key and reject each other's tokens
+        logger.warning("SECRET_KEY is not set, tokens will not survive a restart")
+        os.environ["SECRET_KEY"] = settings.SECRET_KEY
+    if config.workers > 1:
+        # Rooms live in each worker's ConnectionManager, nothing relays between workers
+        logger.warning(
+            "Running %d workers: users of a room only see each other's messages, presence "
+            "and typing when their connections land on the same worker", config.workers
+        )
+    server = DrainingServer(config)
+    logger.info("Starting %d workers with %s loop and %s parser", config.workers, config.loop, config.http)
+
+    if config.workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--production", action="store_true", help="run the production server")
+    parser.add_argument("--workers", type=int, help="worker processes (default: WEB_CONCURRENCY, 1)")
+    args = parser.parse_args()
+    if args.workers and args.workers > 1 and settings.DATABASE_URL.startswith("sqlite"):
+        parser.error("SQLite supports a single worker, its writer queue only serializes writes within one process")
+
+    if args.production:
+        run_production(args.workers or worker_count())
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            reload=settings.DEBUG,
+            log_level="info"
+        )
@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+# Configure a throwaway SQLite database before the application is imported;
+# background flushes are disabled so they do not count towards query budgets
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="chat-tests-"), "chat.db")
+os.environ["READ_DATABASE_URL"] = ""
+os.environ["ROOM_STATS_FLUSH_INTERVAL"] = "3600"
+os.environ["READ_MARKERS_FLUSH_INTERVAL"] = "3600"
+
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture(scope="session")
+def user(client):
+    """Sign up a user and return (user_id, auth headers)."""
+    client.post("/auth/signup", json={"username": "alice", "email": "alice@example.com", "password": "secret"})
+    token = client.post("/auth/login", data={"username": "alice", "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    return client.get("/auth/me", headers=headers).json()["id"], headers
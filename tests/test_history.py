@@ -0,0 +1,68 @@
+from app import crud
+from app.database import SessionLocal
+from app.schemas import MessageCreate
+
+def post(user_id: int, room_id: str, content: str) -> int:
+    db = SessionLocal()
+    try:
+        return crud.create_message(db, MessageCreate(content=content, room_id=room_id), user_id).id
+    finally:
+        db.close()
+
+def test_deleted_newest_message_id_is_not_reused(client, user):
+    user_id, headers = user
+    ids = [post(user_id, "id-room", f"message {i}") for i in range(3)]
+    assert client.delete(f"/chat/messages/{ids[-1]}", headers=headers).status_code == 200
+    assert post(user_id, "id-room", "after the delete") > ids[-1]
+
+def test_history_page_etag(client, user):
+    user_id, headers = user
+    ids = [post(user_id, "cache-room", f"message {i}") for i in range(5)]
+    url = f"/chat/messages/cache-room?cursor={ids[3]}&limit=2"
+
+    response = client.get(url, headers=headers)
+    assert [message["id"] for message in response.json()] == [ids[2], ids[1]]
+    assert response.headers["Cache-Control"].startswith("private, max-age=")
+    etag = response.headers["ETag"]
+
+    revalidated = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+
+    # A newer message does not change a page below it
+    post(user_id, "cache-room", "newer")
+    assert client.get(url, headers={**headers, "If-None-Match": etag}).status_code == 304
+
+def test_history_page_invalidated_by_delete(client, user):
+    user_id, headers = user
+    ids = [post(user_id, "delete-room", f"message {i}") for i in range(5)]
+    url = f"/chat/messages/delete-room?cursor={ids[3]}&limit=2"
+    etag = client.get(url, headers=headers).headers["ETag"]
+
+    assert client.delete(f"/chat/messages/{ids[2]}", headers=headers).status_code == 200
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert [message["id"] for message in response.json()] == [ids[1], ids[0]]
+    assert response.headers["ETag"] != etag
+
+def test_history_pages_that_are_not_cached(client, user):
+    user_id, headers = user
+    newest = post(user_id, "live-room", "newest")
+    # The live page and pages above the newest message can still change
+    assert "ETag" not in client.get("/chat/messages/live-room", headers=headers).headers
+    assert "ETag" not in client.get(f"/chat/messages/live-room?cursor={newest + 5}", headers=headers).headers
+    assert client.get("/chat/messages/live-room?cursor=0", headers=headers).status_code == 422
+
+def test_history_page_above_deleted_newest_message(client, user):
+    user_id, headers = user
+    ids = [post(user_id, "reuse-room", f"message {i}") for i in range(3)]
+    assert client.delete(f"/chat/messages/{ids[-1]}", headers=headers).status_code == 200
+    url = f"/chat/messages/reuse-room?cursor={ids[-1] + 1}"
+    first = client.get(url, headers=headers)
+    assert [message["id"] for message in first.json()] == [ids[1], ids[0]]
+
+    # The next message gets a new id above the page, which stays valid
+    newer = post(user_id, "reuse-room", "after the delete")
+    second = client.get(url, headers=headers)
+    assert newer > ids[-1]
+    assert [message["id"] for message in second.json()] == [ids[1], ids[0]]
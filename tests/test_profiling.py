@@ -0,0 +1,30 @@
+import json
+import sys
+import threading
+from app.profiling import Profiler
+
+def test_download_while_sampling():
+    profiler = Profiler(max_profiles=5)
+    profile = profiler._new_profile("running", 0.001)
+
+    def run():
+        for _ in range(2000):
+            # Stacks are keyed by thread name first, so every sample adds a new stack
+            threading.current_thread().name = f"sampler-{profile.sample_count}"
+            profile.add_stacks({threading.get_ident(): sys._getframe()})
+            profiler._new_profile("slow handler", 0.001)
+
+    # Switch threads as often as possible so the sampler writes during rendering
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    sampler = threading.Thread(target=run)
+    sampler.start()
+    try:
+        while sampler.is_alive():
+            profile.to_collapsed()
+            json.loads(profile.to_speedscope())
+            profiler.list()
+    finally:
+        sampler.join()
+        sys.setswitchinterval(switch_interval)
+    assert profile.sample_count == 2000
@@ -0,0 +1,65 @@
+import pytest
+from app import crud
+from app.database import SessionLocal, QueryBudgetExceeded, query_budget
+from app.read_markers import read_markers
+from app.schemas import MessageCreate
+
+ROOMS = [f"budget-{i:02d}" for i in range(30)]
+
+@pytest.fixture(scope="module")
+def seeded(client, user):
+    """Messages from several authors in 30 rooms, with a read marker in each."""
+    user_id, headers = user
+    author_ids = [user_id]
+    for name in ("bob", "carol"):
+        client.post("/auth/signup", json={"username": name, "email": f"{name}@example.com", "password": "secret"})
+        db = SessionLocal()
+        try:
+            author_ids.append(crud.get_user_by_username(db, name).id)
+        finally:
+            db.close()
+
+    db = SessionLocal()
+    try:
+        for room_id in ROOMS:
+            messages = [
+                crud.create_message(db, MessageCreate(content=f"message {i}", room_id=room_id), author_ids[i % len(author_ids)])
+                for i in range(6)
+            ]
+            read_markers.mark_read(user_id, room_id, messages[1].id)
+    finally:
+        db.close()
+    read_markers.flush()
+    return headers
+
+def test_room_messages_budget(client, seeded):
+    # Authors are loaded with the messages, not one query per author
+    with query_budget(2):
+        response = client.get(f"/chat/messages/{ROOMS[0]}", headers=seeded)
+    assert response.status_code == 200
+    assert len({message["user"]["id"] for message in response.json()}) == 3
+
+def test_room_messages_page_budget(client, seeded):
+    newest = client.get(f"/chat/messages/{ROOMS[0]}?limit=1", headers=seeded).json()[0]["id"]
+    with query_budget(3):
+        response = client.get(f"/chat/messages/{ROOMS[0]}?cursor={newest}", headers=seeded)
+    assert response.status_code == 200
+
+def test_rooms_budget(client, seeded):
+    # All 30 rooms have unflushed statistics, they are merged with one lookup
+    with query_budget(3):
+        response = client.get("/chat/rooms?limit=5", headers=seeded)
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+
+def test_unread_budget(client, seeded):
+    with query_budget(3):
+        response = client.get("/chat/unread", headers=seeded)
+    counts = {room["room_id"]: room["unread"] for room in response.json()}
+    assert all(counts[room_id] == 4 for room_id in ROOMS)
+
+def test_budget_exceeded(client, seeded):
+    with pytest.raises(QueryBudgetExceeded) as excinfo:
+        with query_budget(1):
+            client.get("/chat/unread", headers=seeded)
+    assert "exceeds the budget of 1" in str(excinfo.value)
@@ -0,0 +1,78 @@
+import json
+import pytest
+from sqlalchemy.orm import sessionmaker
+from app import crud, database
+from app.database import SessionLocal
+from app.models import Base, Message, User
+from app.schemas import MessageCreate
+
+ROOM = "replica-room"
+
+@pytest.fixture
+def replica(monkeypatch, tmp_path):
+    """A second database standing in for a replica that stopped replicating."""
+    read_engine = database.create_replica_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(read_engine)
+    router = database.ReplicaRouter(read_engine)
+    monkeypatch.setattr(database, "replica", router)
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=read_engine))
+    yield router
+    read_engine.dispose()
+
+def replicate(read_engine):
+    """Copy the primary's users and messages, as a replica would have so far."""
+    db = SessionLocal()
+    try:
+        tables = [(User.__table__, db.query(User.__table__).all()), (Message.__table__, db.query(Message.__table__).all())]
+    finally:
+        db.close()
+    with read_engine.begin() as connection:
+        for table, _ in reversed(tables):
+            connection.execute(table.delete())
+        for table, rows in tables:
+            if rows:
+                connection.execute(table.insert(), [row._asdict() for row in rows])
+
+def write(user_id: int, content: str) -> int:
+    db = SessionLocal()
+    try:
+        return crud.create_message(db, MessageCreate(content=content, room_id=ROOM), user_id).id
+    finally:
+        db.close()
+
+def test_history_reads_see_own_writes_across_workers(client, user, replica):
+    user_id, headers = user
+    write(user_id, "replicated")
+    replicate(replica.engine)
+    new_id = write(user_id, "not replicated yet")
+
+    # The worker that made the write sends this user's reads to the primary
+    assert client.get(f"/chat/messages/{ROOM}", headers=headers).json()[0]["id"] == new_id
+
+    # Another worker does not know about the write and reads the lagging replica...
+    replica.recent_writes.clear()
+    assert client.get(f"/chat/messages/{ROOM}", headers=headers).json()[0]["id"] < new_id
+
+    # ...unless the client sends the id it wrote
+    marked = {**headers, "X-Min-Message-Id": str(new_id)}
+    assert client.get(f"/chat/messages/{ROOM}", headers=marked).json()[0]["id"] == new_id
+
+    # A replica that has caught up serves the read again
+    replicate(replica.engine)
+    with database.query_budget(3):
+        assert client.get(f"/chat/messages/{ROOM}", headers=marked).json()[0]["id"] == new_id
+
+def test_websocket_history_sees_own_writes_across_workers(client, user, replica):
+    user_id, headers = user
+    replicate(replica.engine)
+    new_id = write(user_id, "written through another worker")
+    replica.recent_writes.clear()
+    token = headers["Authorization"].split()[1]
+
+    with client.websocket_connect(f"/chat/ws/{ROOM}?token={token}&min_message_id={new_id}") as websocket:
+        websocket.send_text(json.dumps({"type": "fetch_history", "request_id": "1", "min_message_id": new_id}))
+        while True:
+            frame = json.loads(websocket.receive_text())
+            if frame["type"] == "history":
+                break
+    assert frame["messages"][0]["message_id"] == new_id
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi import WebSocketDisconnect
+from app import websocket_manager
+from app.crud import create_message, create_message_async
+from app.database import SessionLocal
+from app.routers import chat
+from app.config import settings
+from app.schemas import MessageCreate
+from app.websocket_manager import manager
+
+def token_of(headers: dict) -> str:
+    return headers["Authorization"].split()[1]
+
+def receive_frame(websocket, frame_type: str) -> dict:
+    """Skip frames of other types, such as recent messages and presence."""
+    while True:
+        frame = json.loads(websocket.receive_text())
+        if frame["type"] == frame_type:
+            return frame
+
+def login(client, username: str) -> str:
+    """Sign up (once) and log in a user, returning the token."""
+    client.post("/auth/signup", json={"username": username, "email": f"{username}@example.com", "password": "secret"})
+    return client.post("/auth/login", data={"username": username, "password": "secret"}).json()["access_token"]
+
+def usernames(users: list) -> list:
+    return sorted(user["username"] for user in users)
+
+@pytest.fixture(scope="module")
+def history_ids(user):
+    """Five messages in a room of their own, oldest first."""
+    user_id, _ = user
+    db = SessionLocal()
+    try:
+        return [
+            create_message(db, MessageCreate(content=f"history {i}", room_id="history-room"), user_id).id
+            for i in range(5)
+        ]
+    finally:
+        db.close()
+
+def test_fetch_history_pages(client, user, history_ids):
+    _, headers = user
+    with client.websocket_connect(f"/chat/ws/history-room?token={token_of(headers)}") as websocket:
+        websocket.send_text(json.dumps({"type": "fetch_history", "cursor": history_ids[-1], "limit": 2, "request_id": 7}))
+        page = receive_frame(websocket, "history")
+        assert page["request_id"] == 7
+        assert [message["message_id"] for message in page["messages"]] == [history_ids[3], history_ids[2]]
+        assert page["messages"][0]["content"] == "history 3"
+        assert page["next_cursor"] == history_ids[2]
+
+        # The last page is short and ends the history
+        websocket.send_text(json.dumps({"type": "fetch_history", "cursor": page["next_cursor"], "limit": 3, "request_id": "8"}))
+        page = receive_frame(websocket, "history")
+        assert page["request_id"] == "8"
+        assert [message["message_id"] for message in page["messages"]] == history_ids[1::-1]
+        assert page["next_cursor"] is None
+
+@pytest.mark.parametrize("frame, error", [
+    ({"cursor": "abc", "request_id": "1"}, "cursor and limit must be integers"),
+    ({"limit": 2.5, "request_id": 2}, "cursor and limit must be integers"),
+    ({"request_id": {"id": 3}}, "request_id must be a string or an integer"),
+])
+def test_fetch_history_errors(client, user, history_ids, frame, error):
+    _, headers = user
+    with client.websocket_connect(f"/chat/ws/history-room?token={token_of(headers)}") as websocket:
+        websocket.send_text(json.dumps({"type": "fetch_history", **frame}))
+        page = receive_frame(websocket, "history")
+    assert page["error"] == error
+    assert page["messages"] == []
+    if not isinstance(frame["request_id"], dict):
+        assert page["request_id"] == frame["request_id"]
+
+def test_fetch_history_overloaded(client, user, history_ids, monkeypatch):
+    _, headers = user
+    with client.websocket_connect(f"/chat/ws/history-room?token={token_of(headers)}") as websocket:
+        # Overloaded after the connection was admitted
+        monkeypatch.setattr(websocket_manager.load_monitor, "overload_reason", lambda: "pool wait")
+        websocket.send_text(json.dumps({"type": "fetch_history", "request_id": 4}))
+        page = receive_frame(websocket, "history")
+    assert page == {
+        "type": "history", "request_id": 4, "room_id": "history-room",
+        "messages": [], "next_cursor": None, "error": "Server overloaded, try again later"
+    }
+
+def test_presence_diff_coalescing(client, user, monkeypatch):
+    _, headers = user
+    tokens = {username: login(client, username) for username in ("erin", "frank", "grace")}
+    tokens["alice"] = token_of(headers)
+
+    def connect(username: str):
+        return client.websocket_connect(f"/chat/ws/presence-room?token={tokens[username]}")
+
+    monkeypatch.setattr(settings, "PRESENCE_COALESCE_WINDOW", 0.3)
+    with connect("alice") as alice:
+        assert usernames(receive_frame(alice, "presence_diff")["joined"]) == ["alice"]
+
+        with connect("erin") as erin:
+            # Joins inside one window share a frame, a second connection of a user is not a join
+            with connect("frank"), connect("frank"):
+                diff = receive_frame(alice, "presence_diff")
+                assert (usernames(diff["joined"]), diff["left"]) == (["erin", "frank"], [])
+
+                # A join and a leave inside one window cancel out
+                with connect("grace"):
+                    pass
+                erin.close()
+                diff = receive_frame(alice, "presence_diff")
+                assert (diff["joined"], usernames(diff["left"])) == ([], ["erin"])
+
+        # Frank's last connection leaving is a single leave
+        diff = receive_frame(alice, "presence_diff")
+        assert (diff["joined"], usernames(diff["left"])) == ([], ["frank"])
+
+def test_overloaded_connection_is_shed_before_the_database(client, user, monkeypatch):
+    _, headers = user
+    monkeypatch.setattr(websocket_manager.load_monitor, "overload_reason", lambda: "database pool wait")
+
+    def get_db():
+        raise AssertionError("a shed connection must not check out a database session")
+
+    monkeypatch.setattr(chat, "get_db", get_db)
+    with client.websocket_connect(f"/chat/ws/shed-room?token={token_of(headers)}") as websocket:
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            websocket.receive_text()
+    assert (excinfo.value.code, excinfo.value.reason) == (1013, "Server overloaded (database pool wait)")
+
+def test_user_connection_limit(client, user, monkeypatch):
+    _, headers = user
+    monkeypatch.setattr(settings, "ADMISSION_MAX_USER_CONNECTIONS", 1)
+    with client.websocket_connect(f"/chat/ws/limit-room?token={token_of(headers)}"):
+        with client.websocket_connect(f"/chat/ws/other-room?token={token_of(headers)}") as second:
+            with pytest.raises(WebSocketDisconnect) as excinfo:
+                second.receive_text()
+    assert (excinfo.value.code, excinfo.value.reason) == (1013, "User connection limit reached")
+
+def test_drain_during_in_flight_message(client, user, monkeypatch):
+    user_id, headers = user
+    monkeypatch.setattr(manager, "draining", False)
+    drains = []
+    warnings = []
+
+    async def create_then_drain(db, message, user_id):
+        # The server starts shutting down while the insert is in flight
+        db_message = await create_message_async(db, message, user_id)
+        drains.append(asyncio.ensure_future(manager.drain(1012, "Server restarting", 5)))
+        await asyncio.sleep(0.1)
+        return db_message
+
+    def warning(*args, **kwargs):
+        warnings.append(args)
+        if len(warnings) > 3:
+            # Break out of a handler that keeps failing on the closed socket
+            raise WebSocketDisconnect()
+
+    monkeypatch.setattr(chat, "create_message_async", create_then_drain)
+    monkeypatch.setattr(chat.logger, "warning", warning)
+
+    with client.websocket_connect(f"/chat/ws/drain-room?token={token_of(headers)}") as websocket:
+        websocket.send_text(json.dumps({"content": "in flight"}))
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            while True:
+                websocket.receive_text()
+    assert excinfo.value.code == 1012
+
+    deadline = time.monotonic() + 5
+    while not drains[0].done() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert drains[0].done()
+    assert warnings == []
+    assert not manager.connection_users